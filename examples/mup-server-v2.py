@@ -10,16 +10,45 @@ MUP Server 2.0 - 基于 MCP 设计理念的改进实现
 5. 批量操作和性能优化
 """
 
+import argparse
 import asyncio
+import hashlib
+import hmac
+import inspect
+import itertools
 import json
 import logging
+import multiprocessing
+import os
+import pickle
+import re
+import secrets
+import signal
+import sqlite3
+import tempfile
+import threading
 import time
-from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any, Callable
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Any, Callable, Mapping, Awaitable
 from dataclasses import dataclass, asdict, field
 from enum import Enum
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from types import MappingProxyType
+from collections import OrderedDict, Counter, deque
 import websockets
 
+try:
+    import msgpack
+except ImportError:  # 可选依赖，未安装时仅使用 JSON 编码
+    msgpack = None
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，未安装时列存储使用纯 Python 列表
+    np = None
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -40,6 +69,26 @@ class MessageType(Enum):
     ERROR = "error"
     REQUEST = "request"
 
+class WireCodec(Enum):
+    """线路编码枚举"""
+    JSON = "json"
+    MSGPACK = "msgpack"
+
+def supported_codecs() -> List[WireCodec]:
+    """返回当前环境可用的编码，按服务器偏好排序"""
+    codecs = [WireCodec.JSON]
+    if msgpack is not None:
+        codecs.insert(0, WireCodec.MSGPACK)
+    return codecs
+
+def negotiate_codec(client_codecs: List[str]) -> WireCodec:
+    """按客户端偏好顺序选择双方都支持的编码，默认 JSON"""
+    available = {codec.value: codec for codec in supported_codecs()}
+    for name in client_codecs or []:
+        if name in available:
+            return available[name]
+    return WireCodec.JSON
+
 @dataclass
 class ClientCapabilities:
     """客户端能力描述"""
@@ -48,69 +97,2255 @@ class ClientCapabilities:
     max_component_depth: int
     concurrent_updates: bool
     mcp_integration: bool = False
+    codecs: List[str] = field(default_factory=lambda: [WireCodec.JSON.value])
+    component_templates: bool = False
+
+@dataclass
+class ServerCapabilities:
+    """服务器能力描述"""
+    component_types: List[Dict[str, Any]]
+    event_handlers: List[str]
+    security: Dict[str, Any]
+    performance: Dict[str, Any]
+    mcp_connectors: List[str] = field(default_factory=list)
+    codecs: List[str] = field(default_factory=lambda: [c.value for c in supported_codecs()])
+    compression: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class SecurityContext:
+    """安全上下文"""
+    user_id: str
+    session_id: str
+    auth_token: Optional[str] = None
+    permissions: Dict[str, Any] = field(default_factory=dict)
+    auth_method: str = "none"
+
+@dataclass
+class UIContext:
+    """UI 上下文"""
+    viewport: Dict[str, int]
+    theme: str
+    language: str
+    accessibility: Dict[str, bool]
+    device_type: str = "desktop"
+
+class IdGenerator:
+    """单调唯一 ID 生成器
+    
+    格式为 `{前缀}_{毫秒时间戳}_{节点标识}{序号}`：同一毫秒内靠单调序号区分，
+    节点标识在进程启动时随机生成，多个进程或节点之间也不会冲突。
+    """
+    
+    NODE_TAG = secrets.token_hex(3)
+    
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._sequence = itertools.count(1)
+    
+    def next(self) -> str:
+        return f"{self.prefix}_{int(time.time() * 1000)}_{self.NODE_TAG}{next(self._sequence):x}"
+
+
+message_ids = IdGenerator("msg")
+client_ids = IdGenerator("client")
+notification_ids = IdGenerator("notification")
+
+
+class PreEncodedPayload(dict):
+    """带预编码片段的消息载荷
+    
+    静态字段按编码预先序列化一次，发送时只编码动态字段并拼接；
+    作为普通 dict 仍可被读取。
+    """
+    
+    def __init__(self, static_fields: Dict[str, Any], fragments: Dict['WireCodec', Any],
+                 dynamic_fields: Dict[str, Any]):
+        super().__init__(static_fields)
+        self.update(dynamic_fields)
+        self.static_count = len(static_fields)
+        self.fragments = fragments
+        self.dynamic_fields = dynamic_fields
+
+
+def _msgpack_map_header(size: int) -> bytes:
+    if size < 16:
+        return bytes([0x80 | size])
+    if size < 0x10000:
+        return b"\xde" + size.to_bytes(2, "big")
+    return b"\xdf" + size.to_bytes(4, "big")
+
+
+def _msgpack_pairs(fields: Dict[str, Any]) -> bytes:
+    """将字典编码为不带头部的 MessagePack 键值对序列"""
+    return b"".join(msgpack.packb(k, use_bin_type=True) + msgpack.packb(v, use_bin_type=True)
+                    for k, v in fields.items())
+
+
+def encode_fragment(fields: Dict[str, Any], codec: 'WireCodec') -> Any:
+    """将字典编码为可拼接的片段（JSON 不含花括号，MessagePack 不含映射头）"""
+    if codec == WireCodec.MSGPACK:
+        return _msgpack_pairs(fields)
+    return json.dumps(fields, ensure_ascii=False, separators=(",", ":"))[1:-1]
+
+
+class MUPMessage:
+    """MUP 2.0 消息封装"""
+    
+    def __init__(self, message_type: MessageType, payload: Dict[str, Any], 
+                 version: str = "2.0.0", message_id: str | None = None):
+        self.version = version
+        self.message_type = message_type
+        self.payload = payload
+        self.message_id = message_id or message_ids.next()
+        self.timestamp = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "mup": {
+                "version": self.version,
+                "message_type": self.message_type.value,
+                "message_id": self.message_id,
+                "timestamp": self.timestamp,
+                "payload": self.payload
+            }
+        }
+    
+    def _header(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "message_type": self.message_type.value,
+            "message_id": self.message_id,
+            "timestamp": self.timestamp
+        }
+    
+    def to_json(self, indent: Optional[int] = None) -> str:
+        if indent is not None:
+            return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+        if isinstance(self.payload, PreEncodedPayload):
+            payload = self.payload
+            parts = [payload.fragments[WireCodec.JSON], encode_fragment(payload.dynamic_fields, WireCodec.JSON)]
+            return (f'{{"mup":{{{encode_fragment(self._header(), WireCodec.JSON)},'
+                    f'"payload":{{{",".join(p for p in parts if p)}}}}}}}')
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+    
+    def to_bytes(self) -> bytes:
+        """编码为 MessagePack 二进制帧"""
+        if msgpack is None:
+            raise RuntimeError("二进制编码需要安装 msgpack: pip install msgpack")
+        if isinstance(self.payload, PreEncodedPayload):
+            payload = self.payload
+            header = self._header()
+            return (_msgpack_map_header(1) + msgpack.packb("mup")
+                    + _msgpack_map_header(len(header) + 1) + _msgpack_pairs(header)
+                    + msgpack.packb("payload")
+                    + _msgpack_map_header(payload.static_count + len(payload.dynamic_fields))
+                    + payload.fragments[WireCodec.MSGPACK]
+                    + _msgpack_pairs(payload.dynamic_fields))
+        return msgpack.packb(self.to_dict(), use_bin_type=True)
+    
+    def encode(self, codec: WireCodec = WireCodec.JSON) -> str | bytes:
+        """按协商的编码序列化消息"""
+        if codec == WireCodec.MSGPACK:
+            return self.to_bytes()
+        return self.to_json()
+    
+    @classmethod
+    def from_json(cls, json_str: str) -> 'MUPMessage':
+        return cls._from_dict(json.loads(json_str))
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'MUPMessage':
+        """从 MessagePack 二进制帧解码"""
+        if msgpack is None:
+            raise RuntimeError("二进制编码需要安装 msgpack: pip install msgpack")
+        return cls._from_dict(msgpack.unpackb(data, raw=False))
+    
+    @classmethod
+    def decode(cls, frame: str | bytes) -> 'MUPMessage':
+        """根据帧类型解码：文本帧为 JSON，二进制帧为 MessagePack"""
+        if isinstance(frame, (bytes, bytearray, memoryview)):
+            return cls.from_bytes(bytes(frame))
+        return cls.from_json(frame)
+    
+    @classmethod
+    def _from_dict(cls, data: Dict[str, Any]) -> 'MUPMessage':
+        mup_data = data.get("mup", {})
+        return cls(
+            message_type=MessageType(mup_data.get("message_type")),
+            payload=mup_data.get("payload", {}),
+            version=mup_data.get("version", "2.0.0"),
+            message_id=mup_data.get("message_id")
+        )
+
+def parse_version(version: str) -> tuple:
+    """将语义化版本号解析为可比较的整数元组，忽略预发布后缀"""
+    parts = []
+    for part in str(version).split("-")[0].split(".")[:3]:
+        parts.append(int(part) if part.isdigit() else 0)
+    return tuple(parts + [0] * (3 - len(parts)))
+
+
+class CapabilityIndex:
+    """能力查询索引
+    
+    组件类型按注册顺序编号，特性与类型名各自映射到位集（int），
+    查询时做位与运算，再按版本区间筛选；结果按归一化过滤条件记忆，
+    能力变化时整体失效。
+    """
+    
+    MEMO_SIZE = 256
+    QUERY_TYPES = {
+        "component_availability": "_query_components",
+        "handler_availability": "_query_handlers",
+        "connector_availability": "_query_connectors",
+    }
+    
+    def __init__(self, capabilities: 'ServerCapabilities'):
+        self._capabilities = capabilities
+        self.invalidate()
+    
+    def invalidate(self):
+        self._built = False
+        self._memo: OrderedDict = OrderedDict()
+    
+    def _build(self):
+        components = list(self._capabilities.component_types)
+        self._components = components
+        self._versions = [parse_version(c.get("version", "0.0.0")) for c in components]
+        self._all = (1 << len(components)) - 1
+        self._by_type: Dict[str, int] = {}
+        self._by_namespace: Dict[str, int] = {}
+        self._by_feature: Dict[str, int] = {}
+        for position, component in enumerate(components):
+            bit = 1 << position
+            self._by_type[component["type"]] = self._by_type.get(component["type"], 0) | bit
+            namespace = component.get("namespace")
+            if namespace:
+                self._by_namespace[namespace] = self._by_namespace.get(namespace, 0) | bit
+            for feature in component.get("features", []):
+                self._by_feature[feature] = self._by_feature.get(feature, 0) | bit
+        self._built = True
+    
+    def query(self, query_type: str, filters: Dict[str, Any]) -> List[Any]:
+        """执行查询；不支持的查询类型抛出 ValueError"""
+        if query_type not in self.QUERY_TYPES:
+            raise ValueError(f"不支持的查询类型: {query_type}")
+        key = (query_type, json.dumps(filters, sort_keys=True, default=str))
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            return self._memo[key]
+        if not self._built:
+            self._build()
+        result = getattr(self, self.QUERY_TYPES[query_type])(filters)
+        self._memo[key] = result
+        if len(self._memo) > self.MEMO_SIZE:
+            self._memo.popitem(last=False)
+        return result
+    
+    def _query_components(self, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        mask = self._all
+        if "component_type" in filters:
+            mask &= self._by_type.get(filters["component_type"], 0)
+        if "namespace" in filters:
+            mask &= self._by_namespace.get(filters["namespace"], 0)
+        for feature in filters.get("required_features", []):
+            mask &= self._by_feature.get(feature, 0)
+        if filters.get("any_features"):
+            any_mask = 0
+            for feature in filters["any_features"]:
+                any_mask |= self._by_feature.get(feature, 0)
+            mask &= any_mask
+        
+        min_version = parse_version(filters["min_version"]) if "min_version" in filters else None
+        max_version = parse_version(filters["max_version"]) if "max_version" in filters else None
+        
+        matches = []
+        while mask:
+            low = mask & -mask
+            position = low.bit_length() - 1
+            mask ^= low
+            version = self._versions[position]
+            if min_version is not None and version < min_version:
+                continue
+            if max_version is not None and version > max_version:
+                continue
+            matches.append(self._components[position])
+        return matches
+    
+    def _query_names(self, names: List[str], filters: Dict[str, Any]) -> List[str]:
+        if "name" in filters:
+            return [filters["name"]] if filters["name"] in names else []
+        prefix = filters.get("prefix", "")
+        return [name for name in names if name.startswith(prefix)]
+    
+    def _query_handlers(self, filters: Dict[str, Any]) -> List[str]:
+        return self._query_names(self._capabilities.event_handlers, filters)
+    
+    def _query_connectors(self, filters: Dict[str, Any]) -> List[str]:
+        return self._query_names(self._capabilities.mcp_connectors, filters)
+
+
+class CapabilityDescriptorCache:
+    """握手能力描述缓存
+    
+    服务器信息与能力块按 (协议版本, 编码) 只序列化一次，并计算内容哈希作为 ETag；
+    注册处理器或组件类型后调用 invalidate() 重建。
+    """
+    
+    def __init__(self, build: Callable[[], Dict[str, Any]]):
+        self._build = build
+        self.invalidate()
+    
+    def invalidate(self):
+        self._descriptor: Optional[Dict[str, Any]] = None
+        self._fragments: Dict[tuple, Any] = {}
+        self._etag: Optional[str] = None
+    
+    @property
+    def descriptor(self) -> Dict[str, Any]:
+        if self._descriptor is None:
+            self._descriptor = self._build()
+        return self._descriptor
+    
+    @property
+    def etag(self) -> str:
+        if self._etag is None:
+            canonical = json.dumps(self.descriptor, sort_keys=True, separators=(",", ":"))
+            self._etag = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+        return self._etag
+    
+    def payload(self, version: str, dynamic_fields: Dict[str, Any]) -> PreEncodedPayload:
+        """构建带预编码能力块的握手载荷"""
+        fragments = {}
+        for codec in supported_codecs():
+            key = (version, codec)
+            if key not in self._fragments:
+                self._fragments[key] = encode_fragment(self.descriptor, codec)
+            fragments[codec] = self._fragments[key]
+        return PreEncodedPayload(self.descriptor, fragments, dynamic_fields)
+
+
+_DELETED = object()
+
+class TransactionConflictError(Exception):
+    """事务读取的组件在提交前已被其他写入修改"""
+
+
+class RegistryTransaction:
+    """注册表事务：写入记录在覆盖层中，提交时一次性发布，回滚时直接丢弃"""
+    
+    def __init__(self, registry: 'ComponentRegistry'):
+        self._registry = registry
+        self._base = registry._components
+        self._writes: Dict[str, Any] = {}
+        # 从基线读到的值，提交时校验未被事务外的 set()/remove() 改动
+        self._reads: Dict[str, Any] = {}
+    
+    def get(self, component_id: str) -> Optional[Dict[str, Any]]:
+        if component_id in self._writes:
+            value = self._writes[component_id]
+        else:
+            value = self._base.get(component_id)
+            self._reads.setdefault(component_id, value)
+        return None if value is _DELETED else value
+    
+    def __contains__(self, component_id: str) -> bool:
+        return self.get(component_id) is not None
+    
+    def set(self, component_id: str, component: Dict[str, Any]):
+        self._writes[component_id] = component
+    
+    def remove(self, component_id: str):
+        self._writes[component_id] = _DELETED
+    
+    def update_component(self, component_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        """浅合并组件字段（写时复制，不修改已发布的组件）"""
+        current = self.get(component_id)
+        if current is None:
+            raise ValueError(f"组件 {component_id} 不存在")
+        updated = {**current, **updates}
+        self._writes[component_id] = updated
+        return updated
+    
+    def bind_events(self, component_id: str, events: Dict[str, Any]) -> Dict[str, Any]:
+        """合并组件事件绑定（写时复制）"""
+        current = self.get(component_id)
+        if current is None:
+            raise ValueError(f"组件 {component_id} 不存在")
+        updated = {**current, "events": {**current.get("events", {}), **events}}
+        self._writes[component_id] = updated
+        return updated
+    
+    @property
+    def changed_ids(self) -> List[str]:
+        return list(self._writes)
+    
+    def rollback(self):
+        """丢弃未提交的写入，O(1)"""
+        self._writes = {}
+
+
+class ComponentRegistry:
+    """版本化写时复制组件注册表
+    
+    已发布的状态从不原地修改：读者拿到的快照在写入期间保持一致，
+    未变化的组件在版本之间共享。
+    """
+    
+    def __init__(self):
+        self._components: Dict[str, Dict[str, Any]] = {}
+        self.version = 0
+        self._write_lock = asyncio.Lock()
+        self._listeners: List[Callable[[int, List[str]], None]] = []
+    
+    def snapshot(self) -> Mapping[str, Dict[str, Any]]:
+        """返回当前版本的只读视图"""
+        return MappingProxyType(self._components)
+    
+    def get(self, component_id: str) -> Optional[Dict[str, Any]]:
+        return self._components.get(component_id)
+    
+    def __contains__(self, component_id: str) -> bool:
+        return component_id in self._components
+    
+    def __getitem__(self, component_id: str) -> Dict[str, Any]:
+        return self._components[component_id]
+    
+    def __len__(self) -> int:
+        return len(self._components)
+    
+    def subscribe(self, listener: Callable[[int, List[str]], None]):
+        """注册版本变更监听器，参数为 (新版本号, 变更的组件 ID 列表)"""
+        self._listeners.append(listener)
+    
+    def set(self, component_id: str, component: Dict[str, Any]) -> int:
+        """单组件写入，立即发布新版本"""
+        txn = RegistryTransaction(self)
+        txn.set(component_id, component)
+        return self._publish(txn)
+    
+    def remove(self, component_id: str) -> int:
+        """移除组件，立即发布新版本"""
+        if component_id not in self._components:
+            return self.version
+        txn = RegistryTransaction(self)
+        txn.remove(component_id)
+        return self._publish(txn)
+    
+    def transaction(self) -> '_TransactionScope':
+        """开启写事务：`async with registry.transaction() as txn:`，异常时自动回滚"""
+        return _TransactionScope(self)
+    
+    def _publish(self, txn: RegistryTransaction) -> int:
+        if not txn._writes:
+            return self.version
+        for component_id, value in txn._reads.items():
+            if self._components.get(component_id) is not value:
+                raise TransactionConflictError(f"组件 {component_id} 在事务期间已被修改")
+        components = dict(self._components)
+        for component_id, value in txn._writes.items():
+            if value is _DELETED:
+                components.pop(component_id, None)
+            else:
+                components[component_id] = value
+        self._components = components
+        self.version += 1
+        changed = txn.changed_ids
+        for listener in self._listeners:
+            listener(self.version, changed)
+        return self.version
+
+
+class _TransactionScope:
+    """事务上下文：串行化写事务，正常退出时提交，异常时回滚"""
+    
+    def __init__(self, registry: ComponentRegistry):
+        self._registry = registry
+        self._txn: Optional[RegistryTransaction] = None
+    
+    async def __aenter__(self) -> RegistryTransaction:
+        await self._registry._write_lock.acquire()
+        self._txn = RegistryTransaction(self._registry)
+        return self._txn
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._registry._publish(self._txn)
+            else:
+                self._txn.rollback()
+        finally:
+            self._registry._write_lock.release()
+        return False
+
+
+class BatchTimeoutError(Exception):
+    """批量操作超过截止时间"""
+
+
+class BatchExecutor:
+    """有界、带截止时间的批量操作执行器
+    
+    - 全局与单客户端并发上限，防止单个客户端用大量任务淹没事件循环
+    - 针对同一 component_id 的操作分为一组，组内顺序执行，组间并行
+    - 截止时间到达后取消未完成的操作
+    """
+    
+    def __init__(self, execute: Callable[..., Any], max_operations: int = 50,
+                 global_concurrency: int = 64, per_client_concurrency: int = 8):
+        self._execute = execute
+        self.max_operations = max_operations
+        self.per_client_concurrency = per_client_concurrency
+        self._global_slots = asyncio.Semaphore(global_concurrency)
+        self._client_slots: Dict[Any, asyncio.Semaphore] = {}
+    
+    def release_client(self, client_key: Any):
+        """客户端断开时释放其并发配额"""
+        self._client_slots.pop(client_key, None)
+    
+    async def run(self, client_key: Any, operations: List[Dict[str, Any]], txn: 'RegistryTransaction',
+                  execution_mode: str = "sequential", timeout_ms: Optional[int] = None,
+                  stop_on_error: bool = False) -> List[Dict[str, Any]]:
+        """执行一批操作，按原顺序返回结果（含每个操作的 latency_ms）"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout_ms / 1000 if timeout_ms else None
+        client_slots = self._client_slots.setdefault(
+            client_key, asyncio.Semaphore(self.per_client_concurrency))
+        results: List[Optional[Dict[str, Any]]] = [None] * len(operations)
+        
+        async def run_one(index: int):
+            # 先占单客户端配额再占全局配额，排队中的客户端不会占着全局槽位
+            async with client_slots, self._global_slots:
+                started = time.perf_counter()
+                try:
+                    result = await self._execute(operations[index], txn)
+                except Exception as e:
+                    if stop_on_error:
+                        raise
+                    result = {"operation_id": operations[index].get("operation_id"), "error": str(e)}
+                result["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+                results[index] = result
+        
+        async def run_group(indexes: List[int]):
+            for index in indexes:
+                await run_one(index)
+        
+        if execution_mode == "parallel":
+            groups: Dict[Any, List[int]] = {}
+            for index, op in enumerate(operations):
+                groups.setdefault(op.get("component_id"), []).append(index)
+            tasks = [asyncio.create_task(run_group(indexes)) for indexes in groups.values()]
+            await self._wait_all(tasks, deadline, loop)
+        else:
+            await self._wait_all([asyncio.create_task(run_group(list(range(len(operations)))))],
+                                 deadline, loop)
+        
+        for index, result in enumerate(results):
+            if result is None:
+                if stop_on_error:
+                    raise BatchTimeoutError(f"操作 {operations[index].get('operation_id')} 超时")
+                results[index] = {
+                    "operation_id": operations[index].get("operation_id"),
+                    "status": "timeout",
+                    "error": "超过批量操作截止时间，已取消"
+                }
+        return results
+    
+    @staticmethod
+    async def _wait_all(tasks: List[asyncio.Task], deadline: Optional[float], loop):
+        """等待任务完成；截止时间到达或出现错误时取消其余任务"""
+        timeout = None if deadline is None else max(0.0, deadline - loop.time())
+        done, pending = await asyncio.wait(tasks, timeout=timeout,
+                                           return_when=asyncio.FIRST_EXCEPTION)
+        error = next((t.exception() for t in done if not t.cancelled() and t.exception()), None)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        if error is not None:
+            raise error
+
+
+Middleware = Callable[[str, Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]
+
+
+class Route:
+    """路由表中的一项：已套好中间件的处理链，附带并发上限、超时与延迟统计"""
+    
+    __slots__ = ("name", "handler", "call", "timeout", "max_concurrency", "_slots", "stats")
+    
+    def __init__(self, name: str, handler: Callable[..., Awaitable[Any]],
+                 max_concurrency: Optional[int] = None, timeout: Optional[float] = None):
+        self.name = name
+        self.handler = handler
+        self.call = handler
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.stats = {"calls": 0, "errors": 0, "timeouts": 0, "in_flight": 0,
+                      "total_ms": 0.0, "max_ms": 0.0}
+    
+    async def __call__(self, *args: Any) -> Any:
+        """执行处理链；超时时间包含等待并发配额的时间，超时抛出 asyncio.TimeoutError"""
+        stats = self.stats
+        stats["calls"] += 1
+        started = time.perf_counter()
+        try:
+            work = self.call(*args) if self._slots is None else self._limited(*args)
+            if self.timeout is None:
+                return await work
+            return await asyncio.wait_for(work, self.timeout)
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            raise
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            stats["total_ms"] += elapsed
+            if elapsed > stats["max_ms"]:
+                stats["max_ms"] = elapsed
+    
+    async def _limited(self, *args: Any) -> Any:
+        async with self._slots:
+            self.stats["in_flight"] += 1
+            try:
+                return await self.call(*args)
+            finally:
+                self.stats["in_flight"] -= 1
+    
+    def summary(self) -> Dict[str, Any]:
+        calls = self.stats["calls"]
+        return {
+            **self.stats,
+            "avg_ms": round(self.stats["total_ms"] / calls, 3) if calls else 0.0,
+            "max_concurrency": self.max_concurrency,
+            "timeout": self.timeout
+        }
+
+
+class EventRouter:
+    """预编译路由表
+    
+    注册时把路由键映射到已套好中间件的处理链，分发只需一次字典查找，
+    处理器数量不影响每条消息的匹配开销。中间件形如 middleware(name, next) -> call。
+    """
+    
+    def __init__(self):
+        self._routes: Dict[Any, Route] = {}
+        self._middleware: List[Middleware] = []
+    
+    def use(self, middleware: Middleware):
+        """追加中间件（先注册的在外层），并重新编译所有处理链"""
+        self._middleware.append(middleware)
+        for route in self._routes.values():
+            route.call = self._compose(route.name, route.handler)
+    
+    def add(self, key: Any, handler: Callable[..., Awaitable[Any]], name: Optional[str] = None,
+            max_concurrency: Optional[int] = None, timeout: Optional[float] = None) -> Route:
+        """注册（或替换）路由"""
+        route = Route(name or str(key), handler, max_concurrency, timeout)
+        route.call = self._compose(route.name, handler)
+        self._routes[key] = route
+        return route
+    
+    def remove(self, key: Any):
+        self._routes.pop(key, None)
+    
+    def lookup(self, key: Any) -> Optional[Route]:
+        return self._routes.get(key)
+    
+    def _compose(self, name: str, handler: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        call = handler
+        for middleware in reversed(self._middleware):
+            call = middleware(name, call)
+        return call
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各路由的调用次数、错误、超时与延迟统计"""
+        return {route.name: route.summary() for route in self._routes.values()}
+
+
+class ExecutionClass(Enum):
+    """事件处理器的执行类别，在注册时声明"""
+    INLINE = "inline"     # 协程，直接在事件循环中运行
+    THREAD = "thread"     # 阻塞 I/O（数据库、邮件等），在线程池中运行
+    PROCESS = "process"   # CPU 密集型，在进程池中运行（处理器与参数须可 pickle）
+
+
+class ExecutorBusyError(Exception):
+    """执行器排队已满"""
+    pass
+
+
+def _timed_call(fn: Callable[..., Any], *args: Any) -> tuple:
+    """在工作线程/进程中执行，返回 (开始执行的墙钟时间, 结果) 用于计算排队时间"""
+    return time.time(), fn(*args)
+
+
+class HandlerExecutor:
+    """把阻塞或 CPU 密集型处理器分流到有界线程池/进程池
+    
+    - 每类执行器的在途数量上限为 workers + max_queue，超出时立即拒绝而不是无限排队
+    - 请求被取消（如客户端断开）时，尚未开始执行的任务从池队列中撤下；
+      已在执行的同步代码无法中断，其结果被丢弃
+    """
+    
+    def __init__(self, thread_workers: int = 8, process_workers: int = 2, max_queue: int = 64):
+        self._workers = {ExecutionClass.THREAD: thread_workers, ExecutionClass.PROCESS: process_workers}
+        self._pools: Dict[ExecutionClass, Any] = {}
+        self._slots = {kind: asyncio.Semaphore(workers + max_queue)
+                       for kind, workers in self._workers.items()}
+        self._metrics = {kind: {"submitted": 0, "rejected": 0, "cancelled": 0, "failed": 0,
+                                "completed": 0, "pending": 0, "queue_wait_ms": 0.0,
+                                "max_queue_wait_ms": 0.0, "run_ms": 0.0}
+                         for kind in self._workers}
+    
+    def _pool(self, kind: ExecutionClass):
+        pool = self._pools.get(kind)
+        if pool is None:
+            if kind is ExecutionClass.THREAD:
+                pool = ThreadPoolExecutor(self._workers[kind], thread_name_prefix="mup-handler")
+            else:
+                pool = ProcessPoolExecutor(self._workers[kind])
+            self._pools[kind] = pool
+        return pool
+    
+    async def run(self, kind: ExecutionClass, fn: Callable[..., Any], *args: Any) -> Any:
+        """在指定执行器中运行 fn(*args)；INLINE 时 fn 须为协程函数"""
+        if kind is ExecutionClass.INLINE:
+            return await fn(*args)
+        
+        slots = self._slots[kind]
+        metrics = self._metrics[kind]
+        if slots.locked():
+            metrics["rejected"] += 1
+            raise ExecutorBusyError(f"{kind.value} 执行器排队已满")
+        
+        await slots.acquire()
+        metrics["submitted"] += 1
+        metrics["pending"] += 1
+        submitted = time.time()
+        loop = asyncio.get_running_loop()
+        # 配额在池中任务真正结束时才归还：被取消但仍在执行的任务继续占用配额
+        work = self._pool(kind).submit(_timed_call, fn, *args)
+        work.add_done_callback(lambda _: self._call_soon(loop, self._release, kind))
+        try:
+            started, result = await asyncio.wrap_future(work)
+        except asyncio.CancelledError:
+            metrics["cancelled"] += 1
+            raise
+        except Exception:
+            metrics["failed"] += 1
+            raise
+        
+        waited = max(0.0, (started - submitted) * 1000)
+        metrics["completed"] += 1
+        metrics["queue_wait_ms"] += waited
+        metrics["max_queue_wait_ms"] = max(metrics["max_queue_wait_ms"], waited)
+        metrics["run_ms"] += (time.time() - started) * 1000
+        return result
+    
+    @staticmethod
+    def _call_soon(loop, callback: Callable[..., Any], *args: Any):
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:  # 事件循环已关闭
+            pass
+    
+    def _release(self, kind: ExecutionClass):
+        self._metrics[kind]["pending"] -= 1
+        self._slots[kind].release()
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各执行器的提交、拒绝、取消、占用中数量与排队/执行耗时"""
+        result = {}
+        for kind, metrics in self._metrics.items():
+            completed = metrics["completed"]
+            result[kind.value] = {
+                **metrics,
+                "workers": self._workers[kind],
+                "avg_queue_wait_ms": round(metrics["queue_wait_ms"] / completed, 3) if completed else 0.0
+            }
+        return result
+    
+    def shutdown(self):
+        """关闭线程池与进程池，撤下尚未开始的任务"""
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools.clear()
+
+
+class MessagePipeline:
+    """单连接消息流水线
+    
+    不同排序键的消息并发处理，同一排序键内保持到达顺序；
+    排序键为 None 的消息作为屏障，等待之前的消息全部完成后单独执行。
+    在途消息达到上限时 submit 会阻塞，从而暂停读取 socket 而不是无限排队。
+    """
+    
+    def __init__(self, max_in_flight: int = 16):
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tails: Dict[Any, asyncio.Task] = {}
+        self._in_flight: set = set()
+    
+    async def submit(self, key: Any, work: Callable[[], Any]):
+        """提交一条消息的处理协程工厂"""
+        if key is None:
+            await self.drain()
+            await work()
+            return
+        
+        await self._slots.acquire()
+        previous = self._tails.get(key)
+        task = asyncio.create_task(self._run(key, previous, work))
+        self._tails[key] = task
+        self._in_flight.add(task)
+    
+    async def _run(self, key: Any, previous: Optional[asyncio.Task], work: Callable[[], Any]):
+        try:
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            await work()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"流水线处理消息时出错: {e}")
+        finally:
+            self._slots.release()
+            self._in_flight.discard(asyncio.current_task())
+            if self._tails.get(key) is asyncio.current_task():
+                del self._tails[key]
+    
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+    
+    async def drain(self):
+        """等待所有在途消息处理完成"""
+        if self._in_flight:
+            await asyncio.gather(*list(self._in_flight), return_exceptions=True)
+    
+    async def cancel(self):
+        """连接关闭时取消所有在途消息"""
+        for task in list(self._in_flight):
+            task.cancel()
+        await self.drain()
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒补充，最多积累 burst 个"""
+    
+    __slots__ = ("rate", "burst", "tokens", "updated")
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def try_take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+    
+    def retry_after_ms(self) -> int:
+        return int(max(0.0, 1 - self.tokens) / self.rate * 1000) + 1
+
+
+class ConnectionBudget:
+    """单个连接的限流状态"""
+    
+    __slots__ = ("total", "by_type", "notices", "in_flight", "violations")
+    
+    def __init__(self, total: TokenBucket):
+        self.total = total
+        self.by_type: Dict[str, TokenBucket] = {}
+        self.notices = TokenBucket(1, 5)  # 拒绝通知本身也限速，滥用流量只被静默丢弃
+        self.in_flight = 0
+        self.violations = 0
+
+
+# 在解码前从帧头部嗅探消息类型：JSON 文本，或 MessagePack 的 fixstr 键值
+_SNIFF_TEXT = re.compile(r'"message_type"\s*:\s*"([a-z_]+)"')
+_SNIFF_BYTES = re.compile(rb'message_type(?:"\s*:\s*"|[\xa1-\xbf])([a-z_]+)')
+
+
+def sniff_message_type(frame: str | bytes, limit: int = 512) -> Optional[str]:
+    """不解码整帧，只在前 limit 个字符内查找 message_type"""
+    if isinstance(frame, str):
+        match = _SNIFF_TEXT.search(frame, 0, limit)
+        return match.group(1) if match else None
+    match = _SNIFF_BYTES.search(frame, 0, limit)
+    return match.group(1).decode("ascii") if match else None
+
+
+class AdmissionController:
+    """准入控制：全局连接上限、按连接与按消息类型的令牌桶限流、按优先级降级
+    
+    在解码与处理之前完成判断，拒绝的代价只是一次正则嗅探和几次字典查找。
+    全局在途消息超过阈值时先拒绝批量操作，再拒绝普通事件；握手、状态同步
+    等控制消息只受限流约束，保证交互客户端在过载时仍能连接和恢复。
+    嗅探不到类型的帧按批量操作对待；解码后类型与嗅探结果不符时按真实类型重新计费。
+    """
+    
+    # 0 = 控制消息，1 = 交互事件，2 = 批量操作
+    PRIORITIES = {
+        MessageType.HANDSHAKE_REQUEST.value: 0,
+        MessageType.CAPABILITY_QUERY.value: 0,
+        MessageType.STATE_SYNC.value: 0,
+        MessageType.CONTEXT_TRANSFER.value: 0,
+        MessageType.EVENT_NOTIFICATION.value: 1,
+        MessageType.BATCH_OPERATION.value: 2,
+        None: 2
+    }
+    
+    DEFAULT_TYPE_RATES = {
+        MessageType.HANDSHAKE_REQUEST.value: (1, 3),
+        MessageType.CAPABILITY_QUERY.value: (5, 10),
+        MessageType.STATE_SYNC.value: (2, 5),
+        MessageType.CONTEXT_TRANSFER.value: (2, 5),
+        MessageType.EVENT_NOTIFICATION.value: (30, 60),
+        MessageType.BATCH_OPERATION.value: (2, 4),
+        None: (2, 4)
+    }
+    
+    def __init__(self, max_clients: int, connection_rate: tuple = (50, 100),
+                 type_rates: Optional[Dict[str, tuple]] = None,
+                 shed_thresholds: tuple = (256, 1024), max_violations: int = 200):
+        self.max_clients = max_clients
+        self.connection_rate = connection_rate
+        self.type_rates = {**self.DEFAULT_TYPE_RATES, **(type_rates or {})}
+        # (拒绝批量操作的在途数, 拒绝交互事件的在途数)
+        self.shed_thresholds = shed_thresholds
+        self.max_violations = max_violations
+        self.in_flight = 0
+        self._budgets: Dict[Any, ConnectionBudget] = {}
+        self.stats = {"admitted": 0, "rate_limited": 0, "shed": 0, "connections_rejected": 0}
+    
+    def connect(self, websocket: Any) -> bool:
+        """登记新连接；达到 max_concurrent_clients 时返回 False"""
+        if len(self._budgets) >= self.max_clients:
+            self.stats["connections_rejected"] += 1
+            return False
+        self._budgets[websocket] = ConnectionBudget(TokenBucket(*self.connection_rate))
+        return True
+    
+    def disconnect(self, websocket: Any):
+        budget = self._budgets.pop(websocket, None)
+        if budget is not None:
+            self.in_flight -= budget.in_flight
+    
+    def admit(self, websocket: Any, frame: str | bytes) -> tuple:
+        """准入一帧，返回 (嗅探到的消息类型, 拒绝时的错误负载或 None)"""
+        budget = self._budgets[websocket]
+        message_type = sniff_message_type(frame)
+        rejection = self._check(budget, message_type, budget.total)
+        if rejection is not None:
+            return message_type, rejection
+        budget.violations = 0
+        budget.in_flight += 1
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+        return message_type, None
+    
+    def verify(self, websocket: Any, sniffed: Optional[str],
+               actual: str) -> Optional[Dict[str, Any]]:
+        """解码后核对真实类型；不符时按真实类型的优先级与令牌桶重新判断，拒绝时释放在途计数"""
+        if sniffed == actual:
+            return None
+        budget = self._budgets[websocket]
+        rejection = self._check(budget, actual, None)
+        if rejection is not None:
+            self.done(websocket)
+        return rejection
+    
+    def _check(self, budget: ConnectionBudget, message_type: Optional[str],
+               total: Optional[TokenBucket]) -> Optional[Dict[str, Any]]:
+        priority = self.PRIORITIES.get(message_type, 1)
+        label = message_type or "unknown"
+        
+        if priority > 0:
+            bulk_at, interactive_at = self.shed_thresholds
+            if self.in_flight >= (interactive_at if priority == 1 else bulk_at):
+                self.stats["shed"] += 1
+                budget.violations += 1
+                return {
+                    "error_code": "MUP_SERVICE_UNAVAILABLE",
+                    "error": f"服务器过载，暂时拒绝 {label} 消息",
+                    "retry_after_ms": 1000
+                }
+        
+        bucket = None
+        if message_type in self.type_rates:
+            bucket = budget.by_type.get(message_type)
+            if bucket is None:
+                bucket = budget.by_type[message_type] = TokenBucket(*self.type_rates[message_type])
+        now = time.monotonic()
+        for limiter in (total, bucket):
+            if limiter is not None and not limiter.try_take(now):
+                self.stats["rate_limited"] += 1
+                budget.violations += 1
+                return {
+                    "error_code": "MUP_RATE_LIMIT_EXCEEDED",
+                    "error": f"{label} 消息超过速率限制",
+                    "retry_after_ms": limiter.retry_after_ms()
+                }
+        return None
+    
+    def done(self, websocket: Any):
+        """已准入的消息处理完毕"""
+        budget = self._budgets.get(websocket)
+        if budget is not None:
+            budget.in_flight -= 1
+            self.in_flight -= 1
+    
+    def should_notify(self, websocket: Any) -> bool:
+        """拒绝时是否回复错误（拒绝通知限速）"""
+        budget = self._budgets.get(websocket)
+        return budget is not None and budget.notices.try_take(time.monotonic())
+    
+    def is_abusive(self, websocket: Any) -> bool:
+        """连续被拒绝次数超过上限的连接将被断开"""
+        budget = self._budgets.get(websocket)
+        return budget is not None and budget.violations >= self.max_violations
+
+
+@dataclass
+class TableQuery:
+    """表格视图查询：排序、过滤、全局搜索与分页窗口"""
+    sort_column: Optional[str] = None
+    sort_direction: str = "asc"
+    filters: Dict[str, Any] = field(default_factory=dict)
+    search: Optional[str] = None
+    page: int = 1
+    page_size: int = 10
+    
+    MAX_PAGE_SIZE = 500
+    
+    @classmethod
+    def from_event(cls, event_data: Dict[str, Any], default_page_size: int = 10) -> 'TableQuery':
+        """从表格事件数据构建查询，客户端每次携带完整视图状态"""
+        page_size = int(event_data.get("page_size") or default_page_size)
+        return cls(
+            sort_column=event_data.get("column") or event_data.get("sort_column"),
+            sort_direction="desc" if event_data.get("direction", "asc") == "desc" else "asc",
+            filters=event_data.get("filters") or {},
+            search=event_data.get("search") or None,
+            page=max(1, int(event_data.get("page") or 1)),
+            page_size=max(1, min(page_size, cls.MAX_PAGE_SIZE))
+        )
+    
+    @property
+    def offset(self) -> int:
+        return (self.page - 1) * self.page_size
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "sort_column": self.sort_column,
+            "sort_direction": self.sort_direction,
+            "filters": self.filters,
+            "search": self.search,
+            "page": self.page,
+            "page_size": self.page_size
+        }
+
+
+class TableDataSource(ABC):
+    """data_table 的服务端数据源，只向客户端返回当前页窗口"""
+    
+    @abstractmethod
+    async def query(self, query: TableQuery) -> tuple:
+        """返回 (当前页行列表, 过滤后的总行数)"""
+        pass
+
+
+FILTER_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": lambda value, target: value == target,
+    "ne": lambda value, target: value != target,
+    "gt": lambda value, target: value is not None and value > target,
+    "gte": lambda value, target: value is not None and value >= target,
+    "lt": lambda value, target: value is not None and value < target,
+    "lte": lambda value, target: value is not None and value <= target,
+    "in": lambda value, target: value in target,
+    "contains": lambda value, target: str(target).lower() in str(value).lower(),
+}
+
+
+def normalize_filter(condition: Any) -> tuple:
+    """过滤条件归一化为 (操作符, 目标值)；裸值表示相等"""
+    if isinstance(condition, dict):
+        op = condition.get("op", "eq")
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f"不支持的过滤操作符: {op}")
+        return op, condition.get("value")
+    return "eq", condition
+
+
+class ListDataSource(TableDataSource):
+    """基于内存行列表的数据源"""
+    
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+    
+    async def query(self, query: TableQuery) -> tuple:
+        rows = self.rows
+        for column, condition in query.filters.items():
+            op, target = normalize_filter(condition)
+            match = FILTER_OPERATORS[op]
+            rows = [row for row in rows if match(row.get(column), target)]
+        
+        if query.search:
+            needle = query.search.lower()
+            rows = [row for row in rows
+                    if any(needle in str(value).lower() for value in row.values())]
+        
+        if query.sort_column:
+            column = query.sort_column
+            # None 值始终排在最后
+            present = [row for row in rows if row.get(column) is not None]
+            missing = [row for row in rows if row.get(column) is None]
+            present.sort(key=lambda row: row[column], reverse=query.sort_direction == "desc")
+            rows = present + missing
+        
+        return rows[query.offset:query.offset + query.page_size], len(rows)
+
+
+class ColumnarDataSource(TableDataSource):
+    """列式、带索引的表格数据源
+    
+    - 每列一个数组；数值列在安装 NumPy 时向量化过滤与排序
+    - 按 (列, 方向) 缓存排序置换及其名次数组
+    - 全局搜索使用三元组倒排索引，候选行再做子串校验
+    - 过滤结果按归一化条件做 LRU 缓存
+    预热后重复的排序/过滤/翻页开销接近 O(页大小)。
+    """
+    
+    FILTER_CACHE_SIZE = 64
+    NUMPY_OPERATORS = ("eq", "ne", "gt", "gte", "lt", "lte")
+    
+    def __init__(self, rows: List[Dict[str, Any]], columns: Optional[List[str]] = None):
+        self.column_names = columns or list(dict.fromkeys(key for row in rows for key in row))
+        self._columns: Dict[str, List[Any]] = {name: [] for name in self.column_names}
+        self._size = 0
+        self.append(rows)
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def append(self, rows: List[Dict[str, Any]]):
+        """追加行；所有派生索引失效并在下次查询时惰性重建"""
+        for name, values in self._columns.items():
+            values.extend(row.get(name) for row in rows)
+        self._size += len(rows)
+        self._vectors: Dict[str, Any] = {}
+        self._orders: Dict[tuple, tuple] = {}
+        self._search_text: Optional[List[str]] = None
+        self._search_index: Optional[Dict[str, set]] = None
+        self._selection_cache: OrderedDict = OrderedDict()
+        if np is not None:
+            for name, values in self._columns.items():
+                if values and all(type(v) in (int, float) for v in values):
+                    self._vectors[name] = np.asarray(values)
+    
+    def row(self, index: int) -> Dict[str, Any]:
+        return {name: self._columns[name][index] for name in self.column_names}
+    
+    async def query(self, query: TableQuery) -> tuple:
+        selected: Optional[set] = None
+        for column, condition in query.filters.items():
+            ids = self._filter_ids(column, *normalize_filter(condition))
+            selected = ids if selected is None else selected & ids
+        if query.search:
+            ids = self._search_ids(query.search.lower())
+            selected = ids if selected is None else selected & ids
+        
+        total = self._size if selected is None else len(selected)
+        start, stop = query.offset, query.offset + query.page_size
+        
+        if query.sort_column in self._columns:
+            order, rank = self._order(query.sort_column, query.sort_direction)
+            if selected is None:
+                page_ids = order[start:stop]
+            elif len(selected) * max(1, len(selected).bit_length()) < self._size:
+                # 候选集较小：按名次排序候选行
+                page_ids = sorted(selected, key=rank.__getitem__)[start:stop]
+            else:
+                # 候选集较大：沿缓存的排序置换扫描到页尾即可
+                page_ids = []
+                skipped = 0
+                for index in order:
+                    if index in selected:
+                        if skipped < start:
+                            skipped += 1
+                            continue
+                        page_ids.append(index)
+                        if len(page_ids) >= query.page_size:
+                            break
+        elif selected is None:
+            page_ids = range(start, min(stop, self._size))
+        else:
+            page_ids = sorted(selected)[start:stop]
+        
+        return [self.row(index) for index in page_ids], total
+    
+    def _order(self, column: str, direction: str) -> tuple:
+        """返回缓存的 (排序置换, 名次数组)，None 值始终排在最后"""
+        key = (column, direction)
+        if key not in self._orders:
+            descending = direction == "desc"
+            vector = self._vectors.get(column)
+            if vector is not None:
+                order = np.argsort(-vector if descending else vector, kind="stable").tolist()
+            else:
+                values = self._columns[column]
+                present = [i for i, v in enumerate(values) if v is not None]
+                present.sort(key=values.__getitem__, reverse=descending)
+                order = present + [i for i, v in enumerate(values) if v is None]
+            rank = [0] * self._size
+            for position, index in enumerate(order):
+                rank[index] = position
+            self._orders[key] = (order, rank)
+        return self._orders[key]
+    
+    def _cached_selection(self, key: tuple, compute: Callable[[], set]) -> set:
+        cache = self._selection_cache
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        ids = compute()
+        cache[key] = ids
+        if len(cache) > self.FILTER_CACHE_SIZE:
+            cache.popitem(last=False)
+        return ids
+    
+    def _filter_ids(self, column: str, op: str, target: Any) -> set:
+        key = ("filter", column, op, json.dumps(target, sort_keys=True, default=str))
+        
+        def compute() -> set:
+            vector = self._vectors.get(column)
+            if vector is not None and op in self.NUMPY_OPERATORS and type(target) in (int, float):
+                mask = {
+                    "eq": vector == target, "ne": vector != target,
+                    "gt": vector > target, "gte": vector >= target,
+                    "lt": vector < target, "lte": vector <= target,
+                }[op]
+                return set(np.flatnonzero(mask).tolist())
+            values = self._columns.get(column) or [None] * self._size
+            match = FILTER_OPERATORS[op]
+            return {i for i, value in enumerate(values) if match(value, target)}
+        
+        return self._cached_selection(key, compute)
+    
+    def _search_ids(self, needle: str) -> set:
+        if self._search_text is None:
+            self._build_search_index()
+        
+        def compute() -> set:
+            text = self._search_text
+            grams = {needle[i:i + 3] for i in range(len(needle) - 2)}
+            if not grams:
+                candidates = range(self._size)
+            else:
+                postings = sorted((self._search_index.get(g, set()) for g in grams), key=len)
+                candidates = set.intersection(*postings)
+            return {i for i in candidates if needle in text[i]}
+        
+        return self._cached_selection(("search", needle), compute)
+    
+    def _build_search_index(self):
+        """构建每行的小写文本及三元组倒排索引（按列分隔，避免跨列误匹配）"""
+        text = []
+        index: Dict[str, set] = {}
+        for i in range(self._size):
+            cells = [str(self._columns[name][i]).lower() for name in self.column_names]
+            row_text = "\x1f".join(cells)
+            text.append(row_text)
+            for cell in cells:
+                for j in range(len(cell) - 2):
+                    index.setdefault(cell[j:j + 3], set()).add(i)
+        self._search_text = text
+        self._search_index = index
+
+
+EMAIL_PATTERN = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
+
+
+class ValidationPlan:
+    """表单校验计划：字段声明的规则（required/min_length/max_length/pattern）
+    一次性编译为预编译的检查列表，校验时不再解析规则或正则"""
+    
+    def __init__(self, fields: Dict[str, tuple]):
+        # 字段名 -> (是否必填, ((检查函数, 错误信息), ...))
+        self.fields = fields
+    
+    @classmethod
+    def compile(cls, form: Dict[str, Any]) -> 'ValidationPlan':
+        props = form.get("props", {})
+        rules = props.get("validation") or {}
+        declared = {f["name"]: f for f in props.get("fields", []) if "name" in f}
+        names = list(declared) + [name for name in rules if name not in declared]
+        return cls({name: cls._compile_field(declared.get(name, {}), rules.get(name) or {})
+                    for name in names})
+    
+    @staticmethod
+    def _compile_field(field_spec: Dict[str, Any], rule: Dict[str, Any]) -> tuple:
+        message = rule.get("error_message")
+        checks = []
+        if "min_length" in rule:
+            minimum = rule["min_length"]
+            checks.append((lambda v, n=minimum: len(v) >= n, message or f"至少需要{minimum}个字符"))
+        if "max_length" in rule:
+            maximum = rule["max_length"]
+            checks.append((lambda v, n=maximum: len(v) <= n, message or f"不能超过{maximum}个字符"))
+        is_email = field_spec.get("type") == "email"
+        pattern = rule.get("pattern") or (EMAIL_PATTERN if is_email else None)
+        if pattern:
+            checks.append((re.compile(pattern).match, message or ("邮箱格式不正确" if is_email else "格式不正确")))
+        required = bool(field_spec.get("required") or rule.get("required"))
+        return required, tuple(checks)
+    
+    def validate_field(self, name: str, value: Any) -> Optional[str]:
+        """校验单个字段，返回错误信息；未声明规则的字段视为通过"""
+        compiled = self.fields.get(name)
+        if compiled is None:
+            return None
+        required, checks = compiled
+        if value is None or value == "":
+            return "此字段为必填项" if required else None
+        text = value if isinstance(value, str) else str(value)
+        for check, message in checks:
+            if not check(text):
+                return message
+        return None
+    
+    def validate(self, values: Dict[str, Any]) -> Dict[str, str]:
+        """整表校验，返回 {字段名: 错误信息}"""
+        errors = {}
+        for name in self.fields:
+            error = self.validate_field(name, values.get(name))
+            if error is not None:
+                errors[name] = error
+        return errors
+
+
+class ValidationPlanCache:
+    """按表单组件 ID 缓存校验计划，组件注册表中表单变化时自动失效"""
+    
+    def __init__(self, registry: ComponentRegistry):
+        self._registry = registry
+        self._plans: Dict[str, ValidationPlan] = {}
+        registry.subscribe(self._on_registry_change)
+    
+    def _on_registry_change(self, version: int, changed_ids: List[str]):
+        for component_id in changed_ids:
+            self._plans.pop(component_id, None)
+    
+    def get(self, form_id: Optional[str]) -> Optional[ValidationPlan]:
+        plan = self._plans.get(form_id)
+        if plan is None:
+            form = self._registry.get(form_id) if form_id else None
+            if form is None or form.get("type") != "form":
+                return None
+            plan = self._plans[form_id] = ValidationPlan.compile(form)
+        return plan
+
+
+class ReplayLog:
+    """单个会话的有界重放日志：按发送顺序保存最近 max_entries 条组件更新
+    
+    客户端以最后应用的 message_id 为游标；游标已被截断或未知时返回 None，
+    由调用方退回完整快照。
+    """
+    
+    def __init__(self, max_entries: int = 256):
+        self._entries: deque = deque()
+        self._seq_by_id: Dict[str, int] = {}
+        self._next_seq = 0
+        self.max_entries = max_entries
+    
+    def append(self, message: 'MUPMessage'):
+        if len(self._entries) >= self.max_entries:
+            oldest_seq, oldest = self._entries.popleft()
+            self._seq_by_id.pop(oldest.message_id, None)
+        self._entries.append((self._next_seq, message))
+        self._seq_by_id[message.message_id] = self._next_seq
+        self._next_seq += 1
+    
+    def since(self, message_id: Optional[str]) -> Optional[List['MUPMessage']]:
+        """返回游标之后的所有消息"""
+        seq = self._seq_by_id.get(message_id) if message_id else None
+        if seq is None:
+            return None
+        first_seq = self._entries[0][0]
+        return [message for _, message in itertools.islice(self._entries, seq - first_seq + 1, None)]
+    
+    @property
+    def last_message_id(self) -> Optional[str]:
+        return self._entries[-1][1].message_id if self._entries else None
+
+
+class SessionRegistry:
+    """客户端会话注册表：client_id 与连接双向索引，连接与断开均为 O(1)
+    
+    服务器运行在单线程事件循环中，字典操作之间没有 await，无需加锁。
+    """
+    
+    def __init__(self):
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._by_connection: Dict[Any, str] = {}
+    
+    def add(self, client_id: str, websocket: Any, session: Dict[str, Any]) -> Optional[str]:
+        """登记会话；同一连接重复握手时替换旧会话并返回旧 client_id"""
+        previous = self._by_connection.get(websocket)
+        if previous is not None:
+            self._sessions.pop(previous, None)
+        self._sessions[client_id] = {**session, "websocket": websocket}
+        self._by_connection[websocket] = client_id
+        return previous
+    
+    def client_id_for(self, websocket: Any) -> Optional[str]:
+        return self._by_connection.get(websocket)
+    
+    def remove_connection(self, websocket: Any) -> Optional[str]:
+        """移除连接对应的会话，返回其 client_id"""
+        client_id = self._by_connection.pop(websocket, None)
+        if client_id is not None:
+            self._sessions.pop(client_id, None)
+        return client_id
+    
+    def get(self, client_id: str, default: Any = None) -> Any:
+        return self._sessions.get(client_id, default)
+    
+    def __getitem__(self, client_id: str) -> Dict[str, Any]:
+        return self._sessions[client_id]
+    
+    def __contains__(self, client_id: str) -> bool:
+        return client_id in self._sessions
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def __iter__(self):
+        return iter(self._sessions)
+    
+    def items(self):
+        return self._sessions.items()
+
+
+class StateStore(ABC):
+    """外部状态存储接口（规范 §12.2）：值为可 JSON 序列化的对象，None 表示删除"""
+    
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        pass
+    
+    @abstractmethod
+    async def set_many(self, items: Dict[str, Optional[Any]]):
+        """批量写入；值为 None 的键被删除"""
+        pass
+    
+    @abstractmethod
+    async def scan(self, prefix: str) -> Dict[str, Any]:
+        """返回所有以 prefix 开头的键值"""
+        pass
+    
+    async def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """进程内存储：值按 JSON 序列化保存，与外部存储一样不共享对象引用"""
+    
+    def __init__(self):
+        self._data: Dict[str, str] = {}
+    
+    async def get(self, key: str) -> Optional[Any]:
+        raw = self._data.get(key)
+        return None if raw is None else json.loads(raw)
+    
+    async def set_many(self, items: Dict[str, Optional[Any]]):
+        for key, value in items.items():
+            if value is None:
+                self._data.pop(key, None)
+            else:
+                self._data[key] = json.dumps(value, ensure_ascii=False)
+    
+    async def scan(self, prefix: str) -> Dict[str, Any]:
+        return {key: json.loads(raw) for key, raw in self._data.items() if key.startswith(prefix)}
+
+
+class SqliteStateStore(StateStore):
+    """SQLite 存储：单文件即可在重启后保留状态，也可供同机多个节点共享；
+    数据库调用在线程中执行，不阻塞事件循环"""
+    
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS mup_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._lock = threading.Lock()
+    
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM mup_state WHERE key = ?", (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+    
+    def _set_many(self, items: Dict[str, Optional[Any]]):
+        upserts = [(key, json.dumps(value, ensure_ascii=False))
+                   for key, value in items.items() if value is not None]
+        deletes = [(key,) for key, value in items.items() if value is None]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT INTO mup_state (key, value) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = excluded.value", upserts)
+                if deletes:
+                    self._conn.executemany("DELETE FROM mup_state WHERE key = ?", deletes)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def _scan(self, prefix: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM mup_state WHERE key >= ? AND key < ?",
+                (prefix, prefix + "\uffff")).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+    
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._get, key)
+    
+    async def set_many(self, items: Dict[str, Optional[Any]]):
+        await asyncio.to_thread(self._set_many, items)
+    
+    async def scan(self, prefix: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._scan, prefix)
+    
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedStateStore:
+    """外部存储前的本地缓存：短时读缓存 + 批量延迟写
+    
+    put/delete 只更新本地缓存并标记脏键，后台任务每 flush_interval 秒（或脏键达到
+    batch_size 时）批量写入后端，存储不在每条消息的处理路径上；写入失败的批次保留重试。
+    写回串行执行，每次写入带递增序号，失败重试不会用旧值覆盖之后的写入。
+    后端读取结果只缓存 read_ttl 秒且不缓存不存在的键，共享后端的其他节点写入的数据
+    最迟 read_ttl 秒后可见。
+    """
+    
+    def __init__(self, backend: StateStore, max_entries: int = 10000,
+                 flush_interval: float = 0.1, batch_size: int = 256, read_ttl: float = 1.0):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.read_ttl = read_ttl
+        # key -> (值, 缓存时间)
+        self._cache: OrderedDict = OrderedDict()
+        # key -> (写入序号, 值)
+        self._dirty: Dict[str, tuple] = {}
+        self._sequence = itertools.count()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "misses": 0, "flushes": 0, "written": 0, "failures": 0, "rejected": 0}
+    
+    def _remember(self, key: str, value: Optional[Any]):
+        self._cache[key] = (value, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+    
+    async def get(self, key: str, default: Any = None) -> Any:
+        """读取；未写回的本地写入优先，其次是未过期的缓存，否则从后端加载"""
+        dirty = self._dirty.get(key)
+        if dirty is not None:
+            self.stats["hits"] += 1
+            value = dirty[1]
+        elif key in self._cache and time.monotonic() - self._cache[key][1] < self.read_ttl:
+            self._cache.move_to_end(key)
+            self.stats["hits"] += 1
+            value = self._cache[key][0]
+        else:
+            self.stats["misses"] += 1
+            started = time.monotonic()
+            value = await self.backend.get(key)
+            cached = self._cache.get(key)
+            if cached is not None and cached[1] >= started:
+                # 等待后端期间本地有新的写入（可能已写回并清除脏标记）
+                value = cached[0]
+            elif value is not None:
+                self._remember(key, value)
+            else:
+                self._cache.pop(key, None)
+        return default if value is None else value
+    
+    def put(self, key: str, value: Optional[Any]):
+        """写入本地缓存并安排批量写回后端；不可 JSON 序列化的值被拒绝"""
+        if value is not None:
+            try:
+                json.dumps(value)
+            except (TypeError, ValueError) as e:
+                self.stats["rejected"] += 1
+                logger.error(f"状态 {key} 无法序列化，已忽略本次写入: {e}")
+                return
+        self._remember(key, value)
+        self._dirty[key] = (next(self._sequence), value)
+        self._schedule()
+    
+    def delete(self, key: str):
+        self.put(key, None)
+    
+    async def scan(self, prefix: str) -> Dict[str, Any]:
+        """前缀扫描直接查询后端（先写回脏数据，保证结果包含本地写入）"""
+        await self.flush()
+        return await self.backend.scan(prefix)
+    
+    def _schedule(self):
+        if len(self._dirty) >= self.batch_size:
+            self._wakeup.set()
+        if self._flusher is None or self._flusher.done():
+            try:
+                self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+            except RuntimeError:  # 没有运行中的事件循环，等待显式 flush()
+                pass
+    
+    async def _flush_loop(self):
+        while self._dirty:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+    
+    async def flush(self):
+        """立即把所有脏键写回后端；并发调用按顺序串行写入"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            try:
+                await self.backend.set_many({key: value for key, (_, value) in batch.items()})
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.error(f"状态批量写回失败，逐键重试 {len(batch)} 个键: {e}")
+                await self._flush_each(batch)
+                return
+        self.stats["flushes"] += 1
+        self.stats["written"] += len(batch)
+    
+    async def _flush_each(self, batch: Dict[str, tuple]):
+        """批量写入失败后逐键写入：数据本身无法写入的键丢弃，后端不可用时其余键留待重试"""
+        pending = list(batch.items())
+        for index, (key, (_, value)) in enumerate(pending):
+            try:
+                await self.backend.set_many({key: value})
+            except (TypeError, ValueError) as e:
+                logger.error(f"状态 {key} 写回失败，已丢弃: {e}")
+                continue
+            except Exception:
+                for retry_key, entry in pending[index:]:
+                    # 写入失败期间有更新的值时保留新值
+                    if retry_key not in self._dirty or self._dirty[retry_key][0] < entry[0]:
+                        self._dirty[retry_key] = entry
+                return
+            self.stats["written"] += 1
+    
+    async def close(self):
+        """写回剩余数据并关闭后端"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        await self.flush()
+        await self.backend.close()
+
+
+def parse_size(size: Any) -> int:
+    """解析 "100MB" 形式的容量配置为字节数"""
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?B)?\s*", str(size).upper())
+    if not match:
+        raise ValueError(f"无效的容量: {size}")
+    units = {None: 1, "B": 1, "KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30}
+    return int(float(match.group(1)) * units[match.group(2)])
+
+
+class TemplateStore:
+    """组件模板存储（规范 §6.3 component_templates）
+    
+    模板按内容哈希寻址，按序列化字节数做 LRU 淘汰，并在 ttl 秒后过期。
+    """
+    
+    # 各组件类型中构成骨架、在实例间通常不变的属性
+    TEMPLATE_PROPS = {
+        "form": ("layout", "auto_save"),
+        "data_table": ("pagination", "sorting", "filtering"),
+        "notification": ("duration", "closable", "position"),
+    }
+    
+    def __init__(self, max_bytes: int = 100 << 20, ttl: float = 3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self._entries: OrderedDict = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+    
+    def split(self, component: Dict[str, Any]) -> Optional[tuple]:
+        """将组件拆为 (模板 ID, 模板, 引用)；不适用模板的组件返回 None"""
+        template_props = self.TEMPLATE_PROPS.get(component.get("type"))
+        if template_props is None:
+            return None
+        props = component.get("props", {})
+        template = {
+            "type": component["type"],
+            "version": component.get("version"),
+            "events": component.get("events", {}),
+            "props": {k: props[k] for k in template_props if k in props}
+        }
+        template_id = self.intern(template)
+        reference = {k: v for k, v in component.items() if k not in ("type", "version", "events", "props")}
+        reference["template_ref"] = template_id
+        reference["props"] = {k: v for k, v in props.items() if k not in template["props"]}
+        return template_id, self.get(template_id), reference
+    
+    def intern(self, template: Dict[str, Any]) -> str:
+        canonical = json.dumps(template, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        template_id = "tpl_" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+        entry = self._entries.get(template_id)
+        now = time.monotonic()
+        if entry is not None and now - entry[2] < self.ttl:
+            self._entries.move_to_end(template_id)
+            self.stats["hits"] += 1
+            return template_id
+        
+        self.stats["misses"] += 1
+        if entry is not None:
+            self.bytes -= entry[1]
+        size = len(canonical.encode("utf-8"))
+        self._entries[template_id] = (template, size, now)
+        self._entries.move_to_end(template_id)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.stats["evictions"] += 1
+        return template_id
+    
+    def get(self, template_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(template_id)
+        return entry[0] if entry is not None else None
+
+
+COMPRESSION_ALGORITHMS = ("deflate-dict", "deflate")
+
+
+def build_compression_dictionary(max_size: int = 32 * 1024) -> bytes:
+    """用 ComponentBuilder 的典型输出训练共享压缩字典
+    
+    样本中的时间戳与 ID 固定为常量，保证各进程生成的字典一致；
+    高频键与字符串片段放在字典末尾（deflate 对近距离引用编码更短）。
+    """
+    components = [
+        ComponentBuilder.form("form", [
+            {"name": "name", "type": "text", "label": "", "required": True, "placeholder": ""},
+            {"name": "email", "type": "email", "label": "", "required": True, "placeholder": ""}
+        ], {"name": {"min_length": 2, "max_length": 50}, "email": {"pattern": ""}}),
+        ComponentBuilder.data_table("table", [{"key": "id", "title": "ID", "sortable": True}],
+                                    [{"id": 1}], total_count=1),
+        ComponentBuilder.notification("notification", "", "success")
+    ]
+    samples = []
+    for component in components:
+        component["metadata"]["created_at"] = "2024-01-01T00:00:00.000000Z"
+        message = MUPMessage(MessageType.COMPONENT_UPDATE,
+                             {"status": "success", "component_id": component["id"], "component": component},
+                             message_id="msg")
+        message.timestamp = "2024-01-01T00:00:00.000000Z"
+        samples.append(message.to_json())
+    
+    counts = Counter(token for sample in samples for token in re.findall(r'"[^"]{1,48}":?', sample))
+    frequent = sorted((t for t, n in counts.items() if n > 1), key=lambda t: (counts[t], t))
+    dictionary = ("".join(samples) + "".join(frequent)).encode("utf-8")
+    return dictionary[-max_size:]
+
+
+class FrameCompressor:
+    """单连接压缩上下文（raw deflate，可预置共享字典）
+    
+    帧格式为 1 字节标记 + 压缩数据：
+    0x01 表示连接级上下文帧（按发送顺序共享滑动窗口，小帧也能引用历史数据）；
+    0x02 表示无状态帧（仅依赖字典，供广播在多个连接间共享同一份字节）。
+    """
+    
+    CONTEXT = b"\x01"
+    STATELESS = b"\x02"
+    
+    def __init__(self, dictionary: Optional[bytes] = None, level: int = 6):
+        self.dictionary = dictionary
+        self.level = level
+        self._compressor = self._new_compressor(dictionary, level)
+    
+    @staticmethod
+    def _new_compressor(dictionary: Optional[bytes], level: int):
+        if dictionary:
+            return zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+        return zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    
+    def compress(self, frame: str | bytes) -> bytes:
+        data = frame.encode("utf-8") if isinstance(frame, str) else frame
+        return self.CONTEXT + self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+    
+    @classmethod
+    def compress_stateless(cls, frame: str | bytes, dictionary: Optional[bytes] = None,
+                           level: int = 6) -> bytes:
+        data = frame.encode("utf-8") if isinstance(frame, str) else frame
+        compressor = cls._new_compressor(dictionary, level)
+        return cls.STATELESS + compressor.compress(data) + compressor.flush()
+
+
+class FrameDecompressor:
+    """FrameCompressor 的对端实现（客户端与测试使用）"""
+    
+    def __init__(self, dictionary: Optional[bytes] = None):
+        self.dictionary = dictionary
+        self._decompressor = self._new_decompressor()
+    
+    def _new_decompressor(self):
+        if self.dictionary:
+            return zlib.decompressobj(-zlib.MAX_WBITS, zdict=self.dictionary)
+        return zlib.decompressobj(-zlib.MAX_WBITS)
+    
+    def decompress(self, frame: bytes) -> bytes:
+        flag, body = frame[:1], frame[1:]
+        if flag == FrameCompressor.CONTEXT:
+            return self._decompressor.decompress(body)
+        if flag == FrameCompressor.STATELESS:
+            return self._new_decompressor().decompress(body)
+        raise ValueError(f"未知的压缩帧标记: {flag!r}")
+
+
+class OutboundQueue:
+    """单连接出站队列
+    
+    处理器只负责入队，由独立的写任务发送，慢客户端不会阻塞处理器。
+    同一 component_id 的待发 component_update 合并为最新一条（latest-wins）；
+    积压达到高水位时暂停读取该连接，回落到低水位后恢复；
+    超过 max_size 时只丢弃新的可合并组件更新（之后的同组件更新会取代它），
+    对请求的响应总是发送——读取已在高水位暂停，这类消息的积压受在途请求数限制。
+    """
+    
+    def __init__(self, websocket: Any, high_water: int = 64, low_water: int = 16,
+                 max_size: int = 256):
+        self.websocket = websocket
+        self.high_water = high_water
+        self.low_water = low_water
+        self.max_size = max_size
+        self._pending: OrderedDict = OrderedDict()
+        self._sequence = itertools.count()
+        self._ready = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.stats = {"enqueued": 0, "sent": 0, "merged": 0, "dropped": 0, "max_depth": 0}
+    
+    @staticmethod
+    def coalesce_key(message: MUPMessage) -> Optional[tuple]:
+        """可合并消息的键：指向单个组件的 component_update"""
+        if message.message_type != MessageType.COMPONENT_UPDATE:
+            return None
+        payload = message.payload
+        component_id = payload.get("component_id") or (payload.get("component") or {}).get("id")
+        return ("component", component_id) if component_id else None
+    
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+    
+    def put(self, message: MUPMessage, codec: WireCodec,
+            compressor: Optional[FrameCompressor] = None, critical: bool = False,
+            in_place: bool = True):
+        """入队（不阻塞）；编码与压缩方式在入队时确定，写出时才序列化
+        
+        in_place=False 时被合并的旧消息直接丢弃，新消息排到队尾，
+        用于必须排在其前置消息（如模板注册）之后的更新。
+        """
+        if self.closed:
+            return
+        self.stats["enqueued"] += 1
+        key = self.coalesce_key(message)
+        if key is not None and key in self._pending:
+            self.stats["merged"] += 1
+            if in_place:
+                self._pending[key] = (message, codec, compressor)
+                return
+            del self._pending[key]
+        if len(self._pending) >= self.max_size and key is not None and not critical:
+            self.stats["dropped"] += 1
+            return
+        self._pending[key if key is not None else ("seq", next(self._sequence))] = (message, codec, compressor)
+        depth = len(self._pending)
+        self.stats["max_depth"] = max(self.stats["max_depth"], depth)
+        if depth >= self.high_water:
+            self._writable.clear()
+        self._ready.set()
+    
+    async def writable(self):
+        """积压超过高水位时等待回落到低水位；写任务已结束时立即返回"""
+        if self.closed or (self._writer is not None and self._writer.done()):
+            return
+        await self._writable.wait()
+    
+    def __len__(self) -> int:
+        return len(self._pending)
+    
+    def discard(self, message: MUPMessage) -> bool:
+        """丢弃与 message 可合并的待发消息（已被绕过队列发送的更新取代）"""
+        key = self.coalesce_key(message)
+        if key is None or self._pending.pop(key, None) is None:
+            return False
+        self.stats["merged"] += 1
+        if len(self._pending) <= self.low_water:
+            self._writable.set()
+        return True
+    
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self._pending:
+                    _, (message, codec, compressor) = self._pending.popitem(last=False)
+                    if len(self._pending) <= self.low_water:
+                        self._writable.set()
+                    frame = message.encode(codec)
+                    if compressor is not None:
+                        # 压缩上下文有状态，必须在写任务中按发送顺序压缩
+                        frame = compressor.compress(frame)
+                    await self.websocket.send(frame)
+                    self.stats["sent"] += 1
+                self._ready.clear()
+                self._writable.set()
+        except Exception as e:
+            # 发送失败后连接不可再用：停止入队并关闭连接，读循环随之退出
+            logger.warning(f"出站发送失败，关闭连接: {e}")
+            self.closed = True
+            self._pending.clear()
+            await asyncio.gather(self.websocket.close(), return_exceptions=True)
+        finally:
+            self._writable.set()
+    
+    async def close(self):
+        """停止写任务，丢弃未发送的消息"""
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+        self._writable.set()
+
+
+class BroadcastHub:
+    """主题订阅与广播扇出
+    
+    每条广播按帧格式（编码、是否压缩）只序列化一次，同一份帧数据推送给所有订阅者；
+    写缓冲超过高水位的慢消费者本次被跳过，连续跳过 max_strikes 次后退订，
+    不会拖慢对其他订阅者的推送。广播绕过连接的出站队列直接写出，
+    before_send 在写出前回调，用于丢弃队列中被这条广播取代的旧消息。
+    """
+    
+    def __init__(self, format_for: Callable[[Any], tuple],
+                 encode: Callable[[MUPMessage, tuple], Any],
+                 high_water: int = 1 << 20, max_strikes: int = 3,
+                 before_send: Optional[Callable[[Any, MUPMessage], None]] = None):
+        self._format_for = format_for
+        self._encode = encode
+        self._before_send = before_send
+        self.high_water = high_water
+        self.max_strikes = max_strikes
+        self.topics: Dict[str, set] = {}
+        self._subscriptions: Dict[Any, set] = {}
+        self._strikes: Dict[Any, int] = {}
+        self.stats = {"published": 0, "delivered": 0, "skipped_slow": 0, "failed": 0, "evicted": 0}
+    
+    def subscribe(self, topic: str, websocket: Any):
+        self.topics.setdefault(topic, set()).add(websocket)
+        self._subscriptions.setdefault(websocket, set()).add(topic)
+    
+    def unsubscribe(self, topic: str, websocket: Any):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.topics[topic]
+        topics = self._subscriptions.get(websocket)
+        if topics is not None:
+            topics.discard(topic)
+    
+    def remove_connection(self, websocket: Any):
+        """连接关闭时退订全部主题"""
+        for topic in list(self._subscriptions.pop(websocket, ())):
+            self.unsubscribe(topic, websocket)
+        self._strikes.pop(websocket, None)
+    
+    def publish(self, topic: str, message: MUPMessage) -> Dict[str, int]:
+        """向主题的所有订阅者推送消息，返回本次投递统计"""
+        subscribers = self.topics.get(topic)
+        result = {"delivered": 0, "skipped_slow": 0, "failed": 0}
+        if not subscribers:
+            return result
+        
+        by_format: Dict[tuple, List[Any]] = {}
+        for websocket in list(subscribers):
+            if self._is_slow(websocket):
+                result["skipped_slow"] += 1
+                self._strike(topic, websocket)
+                continue
+            self._strikes.pop(websocket, None)
+            if self._before_send is not None:
+                self._before_send(websocket, message)
+            by_format.setdefault(self._format_for(websocket), []).append(websocket)
+        
+        for frame_format, connections in by_format.items():
+            frame = self._encode(message, frame_format)
+            try:
+                websockets.broadcast(connections, frame, raise_exceptions=True)
+                result["delivered"] += len(connections)
+            except Exception as e:
+                failed = len(getattr(e, "exceptions", [e]))
+                result["failed"] += failed
+                result["delivered"] += len(connections) - failed
+        
+        self.stats["published"] += 1
+        for key, value in result.items():
+            self.stats[key] += value
+        return result
+    
+    def _is_slow(self, websocket: Any) -> bool:
+        transport = getattr(websocket, "transport", None)
+        return transport is not None and transport.get_write_buffer_size() > self.high_water
+    
+    def _strike(self, topic: str, websocket: Any):
+        strikes = self._strikes.get(websocket, 0) + 1
+        self._strikes[websocket] = strikes
+        if strikes >= self.max_strikes:
+            logger.warning(f"订阅者持续积压，已从主题 {topic} 退订")
+            self.unsubscribe(topic, websocket)
+            self._strikes.pop(websocket, None)
+            self.stats["evicted"] += 1
+
+
+class ClusterBus:
+    """工作进程一侧的本地 IPC 通道
+    
+    通过 Unix 域套接字连接监督进程，消息为按行分隔的 JSON；监督进程把每条消息
+    转发给其他所有工作进程，用于跨进程广播与共享组件状态。
+    """
+    
+    def __init__(self, path: str, worker_id: int):
+        self.path = path
+        self.worker_id = worker_id
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self.stats = {"sent": 0, "received": 0}
+    
+    async def connect(self, on_message: Callable[[Dict[str, Any]], Any]):
+        """连接监督进程并开始接收消息；on_message 可以是普通函数或协程函数"""
+        reader, self._writer = await asyncio.open_unix_connection(self.path)
+        self._reader_task = asyncio.create_task(self._read_loop(reader, on_message))
+    
+    async def _reconnect(self, attempts: int = 5) -> Optional[asyncio.StreamReader]:
+        """断开后重连监督进程；重连后监督进程会先回放完整共享状态"""
+        for attempt in range(attempts):
+            await asyncio.sleep(0.5 * 2 ** attempt)
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                continue
+            logger.info(f"工作进程 {self.worker_id} 已重新连接监督进程")
+            return reader
+        return None
+    
+    async def _read_loop(self, reader: asyncio.StreamReader, on_message):
+        while True:
+            line = await reader.readline()
+            if not line:
+                logger.warning(f"工作进程 {self.worker_id} 与监督进程的 IPC 连接已断开，尝试重连")
+                reader = await self._reconnect()
+                if reader is None:
+                    return
+                continue
+            self.stats["received"] += 1
+            try:
+                result = on_message(json.loads(line))
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"处理集群消息出错: {e}")
+    
+    def send(self, kind: str, **fields: Any):
+        """发送一条集群消息（非阻塞写入套接字缓冲区）"""
+        if self._writer is None or self._writer.is_closing():
+            return
+        line = json.dumps({"kind": kind, "origin": self.worker_id, **fields},
+                          ensure_ascii=False, separators=(",", ":"))
+        self._writer.write(line.encode("utf-8") + b"\n")
+        self.stats["sent"] += 1
+    
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
 
-@dataclass
-class ServerCapabilities:
-    """服务器能力描述"""
-    component_types: List[Dict[str, Any]]
-    event_handlers: List[str]
-    security: Dict[str, Any]
-    performance: Dict[str, Any]
-    mcp_connectors: List[str] = field(default_factory=list)
 
-@dataclass
-class SecurityContext:
-    """安全上下文"""
-    user_id: str
-    session_id: str
-    auth_token: Optional[str] = None
-    permissions: Dict[str, Any] = field(default_factory=dict)
-    auth_method: str = "none"
+def _run_worker(host: str, port: int, bus_path: str, worker_id: int, options: Dict[str, Any]):
+    """工作进程入口：共享端口监听，并接入监督进程的 IPC 通道"""
+    server = MUPServerV2(host, port, **options)
+    try:
+        asyncio.run(server.start_server(reuse_port=True, cluster=ClusterBus(bus_path, worker_id)))
+    except KeyboardInterrupt:
+        pass
 
-@dataclass
-class UIContext:
-    """UI 上下文"""
-    viewport: Dict[str, int]
-    theme: str
-    language: str
-    accessibility: Dict[str, bool]
-    device_type: str = "desktop"
 
-class MUPMessage:
-    """MUP 2.0 消息封装"""
+class WorkerSupervisor:
+    """多进程工作模式的监督进程
     
-    def __init__(self, message_type: MessageType, payload: Dict[str, Any], 
-                 version: str = "2.0.0", message_id: str | None = None):
-        self.version = version
-        self.message_type = message_type
-        self.payload = payload
-        self.message_id = message_id or f"msg_{int(time.time() * 1000)}"
-        self.timestamp = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+    - 启动 N 个工作进程，通过 SO_REUSEPORT 共享监听端口，由内核分配连接
+    - 工作进程异常退出时按退避间隔重启
+    - 运行 IPC 中继：转发广播与组件注册表变更，并保存最新的共享组件状态，
+      新启动（或重启）的工作进程连接后先收到完整状态
+    """
     
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "mup": {
-                "version": self.version,
-                "message_type": self.message_type.value,
-                "message_id": self.message_id,
-                "timestamp": self.timestamp,
-                "payload": self.payload
-            }
-        }
+    RESTART_BACKOFF = (0.5, 1, 2, 5, 10)
+    # 稳定运行超过该秒数后清零重启计数
+    STABLE_AFTER = 60
+    # 某个工作进程的中继写缓冲超过该字节数时视为卡住，断开其 IPC 连接（重连后回放完整状态）
+    RELAY_HIGH_WATER = 8 << 20
     
-    def to_json(self) -> str:
-        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+    def __init__(self, host: str = "localhost", port: int = 8080, workers: Optional[int] = None,
+                 **server_options: Any):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.server_options = server_options
+        self.bus_path = os.path.join(tempfile.mkdtemp(prefix="mup-"), "cluster.sock")
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: Dict[int, Any] = {}
+        self._restarts: Dict[int, int] = {}
+        self._started_at: Dict[int, float] = {}
+        self._connections: set = set()
+        self._relay_tasks: set = set()
+        self._shared_state: Dict[str, bytes] = {}
+        self._stopping = False
     
-    @classmethod
-    def from_json(cls, json_str: str) -> 'MUPMessage':
-        data = json.loads(json_str)
-        mup_data = data.get("mup", {})
-        return cls(
-            message_type=MessageType(mup_data.get("message_type")),
-            payload=mup_data.get("payload", {}),
-            version=mup_data.get("version", "2.0.0"),
-            message_id=mup_data.get("message_id")
+    def _spawn(self, worker_id: int):
+        process = self._context.Process(
+            target=_run_worker,
+            args=(self.host, self.port, self.bus_path, worker_id, self.server_options),
+            name=f"mup-worker-{worker_id}"
         )
+        process.start()
+        self._processes[worker_id] = process
+        self._started_at[worker_id] = time.monotonic()
+        logger.info(f"工作进程 {worker_id} 已启动 (pid={process.pid})")
+    
+    async def _relay(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """IPC 中继：先回放共享状态，再把收到的每条消息转发给其他工作进程"""
+        for line in self._shared_state.values():
+            writer.write(line)
+        self._connections.add(writer)
+        self._relay_tasks.add(asyncio.current_task())
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                message = json.loads(line)
+                if message.get("kind") == "registry":
+                    self._shared_state[message["component_id"]] = line
+                for peer in self._connections:
+                    if peer is writer or peer.is_closing():
+                        continue
+                    if peer.transport.get_write_buffer_size() > self.RELAY_HIGH_WATER:
+                        logger.warning("工作进程 IPC 积压过多，断开其连接")
+                        peer.close()
+                        continue
+                    peer.write(line)
+        finally:
+            self._connections.discard(writer)
+            self._relay_tasks.discard(asyncio.current_task())
+            writer.close()
+    
+    async def _monitor(self):
+        """定期检查工作进程，异常退出的按退避间隔重启"""
+        while not self._stopping:
+            await asyncio.sleep(0.5)
+            now = time.monotonic()
+            for worker_id, process in list(self._processes.items()):
+                if process.is_alive():
+                    if now - self._started_at[worker_id] > self.STABLE_AFTER:
+                        self._restarts.pop(worker_id, None)
+                    continue
+                if self._stopping:
+                    continue
+                restarts = self._restarts.get(worker_id, 0)
+                delay = self.RESTART_BACKOFF[min(restarts, len(self.RESTART_BACKOFF) - 1)]
+                logger.warning(f"工作进程 {worker_id} 已退出 (exitcode={process.exitcode})，{delay}s 后重启")
+                self._restarts[worker_id] = restarts + 1
+                del self._processes[worker_id]
+                asyncio.get_running_loop().call_later(delay, self._respawn, worker_id)
+    
+    def _respawn(self, worker_id: int):
+        if not self._stopping and worker_id not in self._processes:
+            self._spawn(worker_id)
+    
+    async def run(self):
+        """启动 IPC 中继与全部工作进程，收到 SIGINT/SIGTERM 时停止"""
+        relay = await asyncio.start_unix_server(self._relay, path=self.bus_path)
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        logger.info(f"MUP Server v2.0 以 {self.workers} 个工作进程监听 ws://{self.host}:{self.port}")
+        
+        monitor = asyncio.create_task(self._monitor())
+        try:
+            await stop.wait()
+        finally:
+            self._stopping = True
+            monitor.cancel()
+            for process in self._processes.values():
+                process.terminate()
+            for process in self._processes.values():
+                process.join(timeout=5)
+            relay.close()
+            for writer in list(self._connections):
+                writer.close()
+            if self._relay_tasks:
+                await asyncio.wait(list(self._relay_tasks), timeout=1)
+            await relay.wait_closed()
+            if os.path.exists(self.bus_path):
+                os.unlink(self.bus_path)
+            os.rmdir(os.path.dirname(self.bus_path))
+            logger.info("所有工作进程已停止")
+
 
 class ComponentBuilder:
     """增强的组件构建器"""
@@ -156,22 +2391,31 @@ class ComponentBuilder:
     
     @staticmethod
     def data_table(table_id: str, columns: List[Dict[str, Any]], 
-                   data: List[Dict[str, Any]] | None = None) -> Dict[str, Any]:
-        """创建数据表格组件"""
+                   data: List[Dict[str, Any]] | None = None,
+                   page_size: int = 10,
+                   total_count: Optional[int] = None) -> Dict[str, Any]:
+        """创建数据表格组件
+        
+        传入 total_count 时表示 data 只是服务端数据源的当前页窗口。
+        """
+        pagination: Dict[str, Any] = {"enabled": True, "page_size": page_size}
+        if total_count is not None:
+            pagination.update({"server_side": True, "page": 1, "total_count": total_count})
         return ComponentBuilder.create_component(
             "data_table",
             table_id,
             props={
                 "columns": columns,
                 "data": data or [],
-                "pagination": {"enabled": True, "page_size": 10},
+                "pagination": pagination,
                 "sorting": {"enabled": True, "multi_column": False},
                 "filtering": {"enabled": True, "global_search": True}
             },
             events={
                 "on_row_click": {"handler": "handle_row_selection"},
                 "on_sort": {"handler": "handle_table_sort"},
-                "on_filter": {"handler": "handle_table_filter"}
+                "on_filter": {"handler": "handle_table_filter"},
+                "on_page_change": {"handler": "handle_table_page"}
             }
         )
     
@@ -197,13 +2441,33 @@ class ComponentBuilder:
 class MUPServerV2:
     """MUP 2.0 服务器实现"""
     
-    def __init__(self, host: str = "localhost", port: int = 8080):
+    def __init__(self, host: str = "localhost", port: int = 8080,
+                 max_in_flight_per_connection: int = 16,
+                 compression_level: int = 6,
+                 state_store: Optional[StateStore] = None,
+                 session_ttl: float = 3600):
         self.host = host
         self.port = port
-        self.clients: Dict[str, Dict[str, Any]] = {}
+        self.max_in_flight_per_connection = max_in_flight_per_connection
+        self.compression_level = compression_level
+        self.clients = SessionRegistry()
         self.event_handlers: Dict[str, Callable] = {}
-        self.component_registry: Dict[str, Dict[str, Any]] = {}
+        self.handler_executor = HandlerExecutor()
+        # 多进程模式下与其他工作进程同步广播和组件状态的 IPC 通道
+        self.cluster: Optional[ClusterBus] = None
+        self._applying_remote = False
+        self.router = EventRouter()
+        self.router.add(MessageType.HANDSHAKE_REQUEST, self._handle_handshake, name="handshake")
+        self.router.add(MessageType.CAPABILITY_QUERY, self._handle_capability_query, name="capability_query")
+        self.router.add(MessageType.BATCH_OPERATION, self._handle_batch_operation, name="batch_operation")
+        self.component_registry = ComponentRegistry()
         self.security_contexts: Dict[str, SecurityContext] = {}
+        self.table_sources: Dict[str, TableDataSource] = {}
+        self.connection_codecs: Dict[Any, WireCodec] = {}
+        self.outbound_queues: Dict[Any, OutboundQueue] = {}
+        self.connection_compressors: Dict[Any, FrameCompressor] = {}
+        self.compression_dictionary = build_compression_dictionary()
+        self.compression_dictionary_id = hashlib.sha256(self.compression_dictionary).hexdigest()[:16]
         
         # 注册默认事件处理器
         self._register_default_handlers()
@@ -232,6 +2496,8 @@ class MUPServerV2:
                 "handle_field_validation",
                 "handle_row_selection",
                 "handle_table_sort",
+                "handle_table_filter",
+                "handle_table_page",
                 "handle_notification_close"
             ],
             security={
@@ -242,20 +2508,133 @@ class MUPServerV2:
             performance={
                 "max_concurrent_clients": 100,
                 "batch_operation_limit": 50,
-                "component_cache_ttl": 3600
+                "component_cache_ttl": 3600,
+                "component_templates": {"ttl": 3600, "max_size": "100MB"}
             },
-            mcp_connectors=["postgres", "file_system", "web_api"]
+            mcp_connectors=["postgres", "file_system", "web_api"],
+            compression={
+                "algorithms": list(COMPRESSION_ALGORITHMS),
+                "dictionary_id": self.compression_dictionary_id,
+                "level": compression_level
+            }
+        )
+        
+        self.broadcast_hub = BroadcastHub(self._frame_format, self._encode_broadcast,
+                                          before_send=self._supersede_pending)
+        template_policy = self.capabilities.performance["component_templates"]
+        self.template_store = TemplateStore(
+            max_bytes=parse_size(template_policy["max_size"]),
+            ttl=self.capabilities.performance["component_cache_ttl"]
+        )
+        # 每个启用模板的连接已注册的模板及其过期时间
+        self.client_templates: Dict[Any, Dict[str, float]] = {}
+        
+        self.capability_cache = CapabilityDescriptorCache(self._build_capability_descriptor)
+        self.capability_index = CapabilityIndex(self.capabilities)
+        
+        self.admission = AdmissionController(self.capabilities.performance["max_concurrent_clients"])
+        
+        self.batch_executor = BatchExecutor(
+            self._execute_operation,
+            max_operations=self.capabilities.performance["batch_operation_limit"]
         )
+        self.validation_plans = ValidationPlanCache(self.component_registry)
+        
+        # 会话、安全上下文与组件注册表写入外部存储（规范 §12.2），热数据留在本地缓存
+        self.state = CachedStateStore(state_store or MemoryStateStore())
+        # 断开超过 session_ttl 秒的会话记录从存储中清除
+        self.session_ttl = session_ttl
+        self.component_registry.subscribe(self._persist_registry_change)
+        
+        # 断线重连的增量恢复：每个会话最近的组件更新，按会话数上限淘汰最久未活动的。
+        # 日志只在本进程内存中；多工作进程模式下重连可能落到其他进程，此时退回完整快照
+        self.replay_logs: OrderedDict = OrderedDict()
+        self.max_replay_sessions = 1000
+        self.connection_sessions: Dict[Any, str] = {}
+        self.router.add(MessageType.STATE_SYNC, self._handle_state_sync, name="state_sync")
+        self.router.add(MessageType.CONTEXT_TRANSFER, self._handle_context_transfer, name="context_transfer")
+    
+    def _build_capability_descriptor(self) -> Dict[str, Any]:
+        """握手响应中的静态部分：服务器信息与能力块"""
+        return {
+            "server_info": {
+                "name": "MUP Server v2.0",
+                "version": "2.0.0",
+                "description": "基于 MCP 设计理念的增强 UI 服务器",
+                "vendor": "MUP Protocol Team"
+            },
+            "capabilities": asdict(self.capabilities)
+        }
+    
+    def register_event_handler(self, name: str, handler: Callable,
+                               max_concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                               execution: ExecutionClass = ExecutionClass.INLINE):
+        """注册事件处理器并使能力缓存与索引失效
+        
+        execution 为 INLINE 时 handler 是协程函数；THREAD/PROCESS 时 handler 是
+        接收 event_data 的同步函数，在对应执行器中运行。
+        """
+        self._add_event_route(name, handler, max_concurrency, timeout, execution)
+        if name not in self.capabilities.event_handlers:
+            self.capabilities.event_handlers.append(name)
+        self._capabilities_changed()
+    
+    def register_component_type(self, descriptor: Dict[str, Any]):
+        """注册（或替换同名）组件类型并使能力缓存与索引失效"""
+        component_types = [c for c in self.capabilities.component_types
+                           if c["type"] != descriptor["type"]]
+        component_types.append(descriptor)
+        self.capabilities.component_types = component_types
+        self._capabilities_changed()
+    
+    def _capabilities_changed(self):
+        """能力变化后使握手缓存与查询索引失效"""
+        self.capability_cache.invalidate()
+        self.capability_index.invalidate()
+    
+    def _add_event_route(self, name: str, handler: Callable,
+                         max_concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                         execution: ExecutionClass = ExecutionClass.INLINE):
+        """把事件处理器编译为 (EVENT_NOTIFICATION, 处理器名) 路由，结果包装为组件更新"""
+        is_coroutine = inspect.iscoroutinefunction(handler)
+        if execution == ExecutionClass.INLINE and not is_coroutine:
+            raise ValueError(f"处理器 {name} 以 inline 方式运行，必须是协程函数")
+        if execution != ExecutionClass.INLINE and is_coroutine:
+            raise ValueError(f"处理器 {name} 以 {execution.value} 方式运行，必须是同步函数")
+        if execution == ExecutionClass.PROCESS:
+            try:
+                pickle.dumps(handler)
+            except Exception as e:
+                raise ValueError(f"处理器 {name} 无法序列化到进程池（需为模块级函数）: {e}")
+        self.event_handlers[name] = handler
+        run = self.handler_executor.run
+        
+        async def call(websocket, message: MUPMessage) -> MUPMessage:
+            return MUPMessage(MessageType.COMPONENT_UPDATE, await run(execution, handler, message.payload))
+        
+        self.router.add((MessageType.EVENT_NOTIFICATION, name), call, name=name,
+                        max_concurrency=max_concurrency, timeout=timeout)
     
     def _register_default_handlers(self):
         """注册默认事件处理器"""
-        self.event_handlers.update({
+        for name, handler in {
             "handle_form_submit": self._handle_form_submit,
             "handle_field_validation": self._handle_field_validation,
             "handle_row_selection": self._handle_row_selection,
             "handle_table_sort": self._handle_table_sort,
+            "handle_table_filter": self._handle_table_filter,
+            "handle_table_page": self._handle_table_page,
             "handle_notification_close": self._handle_notification_close
-        })
+        }.items():
+            self._add_event_route(name, handler)
+    
+    async def create_paged_table(self, table_id: str, columns: List[Dict[str, Any]],
+                                 source: TableDataSource, page_size: int = 10) -> Dict[str, Any]:
+        """绑定数据源并创建只包含首页数据的表格组件"""
+        self.table_sources[table_id] = source
+        rows, total_count = await source.query(TableQuery(page_size=page_size))
+        return ComponentBuilder.data_table(table_id, columns, rows,
+                                           page_size=page_size, total_count=total_count)
     
     async def _handle_handshake(self, websocket, 
                                message: MUPMessage) -> MUPMessage:
@@ -264,42 +2643,72 @@ class MUPServerV2:
         context = message.payload.get("context", {})
         
         # 创建客户端会话
-        client_id = f"client_{int(time.time() * 1000)}"
-        self.clients[client_id] = {
-            "websocket": websocket,
+        client_id = client_ids.next()
+        # 已存在的会话只能经 context_transfer（校验恢复令牌）接管，握手时改为服务器分配新会话
+        session_id = context.get("session_id") or client_id
+        if session_id != client_id and await self._session_exists(session_id):
+            logger.warning(f"握手请求的会话 {session_id} 已存在，改为分配新会话")
+            session_id = client_id
+        context = {**context, "session_id": session_id}
+        # 恢复令牌只在握手响应中下发一次，存储中只保留其哈希
+        resume_token = secrets.token_urlsafe(32)
+        client_capabilities = ClientCapabilities(**client_info.get("capabilities", {}))
+        codec = negotiate_codec(client_capabilities.codecs)
+        replaced = self.clients.add(client_id, websocket, {
             "info": client_info,
             "context": context,
             "connected_at": datetime.utcnow(),
-            "capabilities": ClientCapabilities(**client_info.get("capabilities", {}))
-        }
+            "capabilities": client_capabilities,
+            "codec": codec,
+            "resume_token_hash": self._hash_resume_token(resume_token)
+        })
+        if replaced:
+            self.security_contexts.pop(replaced, None)
+        if client_capabilities.component_templates:
+            self.client_templates[websocket] = {}
+        
+        # 订阅共享看板等广播主题
+        for topic in context.get("subscriptions", []):
+            self.broadcast_hub.subscribe(topic, websocket)
         
         # 创建安全上下文
         user_id = context.get("user_id", "anonymous")
-        session_id = context.get("session_id", client_id)
         self.security_contexts[client_id] = SecurityContext(
             user_id=user_id,
             session_id=session_id
         )
         
+        self.connection_sessions[websocket] = session_id
+        self._persist_session(client_id)
+        
         logger.info(f"客户端 {client_id} 已连接: {client_info.get('name', 'Unknown')}")
         
-        # 返回服务器能力
+        compression = self._negotiate_compression(message.payload.get("compression") or {})
+        
+        dynamic_fields = {
+            "client_id": client_id,
+            "codec": codec.value,
+            "capability_hash": self.capability_cache.etag,
+            "session_info": {
+                "session_id": session_id,
+                "resume_token": resume_token,
+                "server_time": datetime.utcnow().isoformat() + "Z"
+            }
+        }
+        if compression:
+            dynamic_fields["compression"] = compression
+        
+        # 客户端缓存的能力哈希未变化时返回简短响应
+        if message.payload.get("capability_hash") == self.capability_cache.etag:
+            return MUPMessage(
+                MessageType.HANDSHAKE_RESPONSE,
+                {"capabilities_unchanged": True, **dynamic_fields}
+            )
+        
+        # 返回服务器能力（静态部分已预编码）
         return MUPMessage(
             MessageType.HANDSHAKE_RESPONSE,
-            {
-                "server_info": {
-                    "name": "MUP Server v2.0",
-                    "version": "2.0.0",
-                    "description": "基于 MCP 设计理念的增强 UI 服务器",
-                    "vendor": "MUP Protocol Team"
-                },
-                "capabilities": asdict(self.capabilities),
-                "client_id": client_id,
-                "session_info": {
-                    "session_id": session_id,
-                    "server_time": datetime.utcnow().isoformat() + "Z"
-                }
-            }
+            self.capability_cache.payload("2.0.0", dynamic_fields)
         )
     
     async def _handle_capability_query(self, websocket,
@@ -307,43 +2716,34 @@ class MUPServerV2:
         """处理能力查询"""
         query_type = message.payload.get("query_type")
         filters = message.payload.get("filters", {})
+        pagination = message.payload.get("pagination", {})
         
-        if query_type == "component_availability":
-            # 根据过滤条件返回可用组件
-            available_components = []
-            for comp_type in self.capabilities.component_types:
-                if self._matches_filters(comp_type, filters):
-                    available_components.append(comp_type)
-            
+        try:
+            matches = self.capability_index.query(query_type, filters)
+        except ValueError as e:
             return MUPMessage(
-                MessageType.CAPABILITY_RESPONSE,
-                {
-                    "query_type": query_type,
-                    "available_components": available_components,
-                    "total_count": len(available_components)
-                }
+                MessageType.ERROR,
+                {"error": str(e)}
             )
         
+        result_key = {
+            "component_availability": "available_components",
+            "handler_availability": "available_handlers",
+            "connector_availability": "available_connectors"
+        }[query_type]
+        page = max(1, int(pagination.get("page", 1)))
+        page_size = int(pagination.get("page_size", len(matches) or 1))
+        start = (page - 1) * page_size
+        
         return MUPMessage(
-            MessageType.ERROR,
-            {"error": f"不支持的查询类型: {query_type}"}
+            MessageType.CAPABILITY_RESPONSE,
+            {
+                "query_type": query_type,
+                result_key: matches[start:start + page_size],
+                "total_count": len(matches)
+            }
         )
     
-    def _matches_filters(self, component: Dict[str, Any], 
-                        filters: Dict[str, Any]) -> bool:
-        """检查组件是否匹配过滤条件"""
-        if "component_type" in filters:
-            if component["type"] != filters["component_type"]:
-                return False
-        
-        if "required_features" in filters:
-            component_features = set(component.get("features", []))
-            required_features = set(filters["required_features"])
-            if not required_features.issubset(component_features):
-                return False
-        
-        return True
-    
     async def _handle_batch_operation(self, websocket,
                                     message: MUPMessage) -> MUPMessage:
         """处理批量操作"""
@@ -351,32 +2751,38 @@ class MUPServerV2:
         execution_mode = message.payload.get("execution_mode", "sequential")
         rollback_on_error = message.payload.get("rollback_on_error", False)
         
-        results = []
+        timeout_ms = message.payload.get("timeout")
         
-        if execution_mode == "parallel":
-            # 并行执行
-            tasks = []
-            for op in operations:
-                task = asyncio.create_task(self._execute_operation(op))
-                tasks.append(task)
-            
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-        else:
-            # 顺序执行
-            for op in operations:
-                try:
-                    result = await self._execute_operation(op)
-                    results.append(result)
-                except Exception as e:
-                    if rollback_on_error:
-                        # 回滚之前的操作
-                        await self._rollback_operations(results)
-                        return MUPMessage(
-                            MessageType.ERROR,
-                            {"error": f"批量操作失败，已回滚: {str(e)}"}
-                        )
-                    else:
-                        results.append({"error": str(e)})
+        if len(operations) > self.batch_executor.max_operations:
+            return MUPMessage(
+                MessageType.ERROR,
+                {
+                    "error_code": "MUP_PAYLOAD_TOO_LARGE",
+                    "error": f"批量操作数 {len(operations)} 超过上限 {self.batch_executor.max_operations}"
+                }
+            )
+        
+        try:
+            # 整个批次在一个事务内执行，提交前其他读者看不到中间状态
+            async with self.component_registry.transaction() as txn:
+                results = await self.batch_executor.run(
+                    websocket, operations, txn,
+                    execution_mode=execution_mode,
+                    timeout_ms=timeout_ms,
+                    stop_on_error=rollback_on_error
+                )
+        except TransactionConflictError as e:
+            logger.warning(f"批量操作与并发写入冲突，已回滚: {e}")
+            return MUPMessage(
+                MessageType.ERROR,
+                {"error_code": "MUP_CONFLICT", "error": f"批量操作冲突，已回滚: {str(e)}"}
+            )
+        except Exception as e:
+            logger.warning(f"批量操作失败，已回滚到版本 {self.component_registry.version}")
+            return MUPMessage(
+                MessageType.ERROR,
+                {"error": f"批量操作失败，已回滚: {str(e)}"}
+            )
         
         return MUPMessage(
             MessageType.COMPONENT_UPDATE,
@@ -384,11 +2790,13 @@ class MUPServerV2:
                 "batch_results": results,
                 "execution_mode": execution_mode,
                 "total_operations": len(operations),
-                "successful_operations": sum(1 for r in results if isinstance(r, dict) and "error" not in r)
+                "successful_operations": sum(1 for r in results if isinstance(r, dict) and "error" not in r),
+                "registry_version": self.component_registry.version
             }
         )
     
-    async def _execute_operation(self, operation: Dict[str, Any]) -> Dict[str, Any]:
+    async def _execute_operation(self, operation: Dict[str, Any],
+                                 txn: RegistryTransaction) -> Dict[str, Any]:
         """执行单个操作"""
         op_type = operation.get("type")
         op_id = operation.get("operation_id")
@@ -398,41 +2806,29 @@ class MUPServerV2:
             updates = operation.get("updates", {})
             
             # 更新组件
-            if component_id in self.component_registry:
-                self.component_registry[component_id].update(updates)
-                return {
-                    "operation_id": op_id,
-                    "status": "success",
-                    "component_id": component_id
-                }
-            else:
-                raise ValueError(f"组件 {component_id} 不存在")
+            txn.update_component(component_id, updates)
+            return {
+                "operation_id": op_id,
+                "status": "success",
+                "component_id": component_id
+            }
         
         elif op_type == "event_binding":
             component_id = operation.get("component_id")
             events = operation.get("events", {})
             
             # 绑定事件
-            if component_id in self.component_registry:
-                self.component_registry[component_id]["events"].update(events)
-                return {
-                    "operation_id": op_id,
-                    "status": "success",
-                    "component_id": component_id,
-                    "events_bound": len(events)
-                }
-            else:
-                raise ValueError(f"组件 {component_id} 不存在")
+            txn.bind_events(component_id, events)
+            return {
+                "operation_id": op_id,
+                "status": "success",
+                "component_id": component_id,
+                "events_bound": len(events)
+            }
         
         else:
             raise ValueError(f"不支持的操作类型: {op_type}")
     
-    async def _rollback_operations(self, results: List[Dict[str, Any]]):
-        """回滚操作"""
-        # 这里应该实现具体的回滚逻辑
-        logger.warning("执行操作回滚...")
-        pass
-    
     # 事件处理器实现
     async def _handle_form_submit(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
         """处理表单提交"""
@@ -441,17 +2837,19 @@ class MUPServerV2:
         
         logger.info(f"表单 {component_id} 提交: {form_data}")
         
-        # 模拟表单验证和处理
-        if "email" in form_data and "@" not in form_data["email"]:
+        # 使用表单声明的校验规则整表校验
+        plan = self.validation_plans.get(component_id)
+        field_errors = plan.validate(form_data) if plan else {}
+        if field_errors:
             return {
                 "status": "error",
-                "message": "邮箱格式不正确",
-                "field_errors": {"email": "请输入有效的邮箱地址"}
+                "message": "表单校验失败",
+                "field_errors": field_errors
             }
         
         # 创建成功通知
         notification = ComponentBuilder.notification(
-            f"notification_{int(time.time())}",
+            notification_ids.next(),
             "表单提交成功！",
             "success"
         )
@@ -463,22 +2861,25 @@ class MUPServerV2:
         }
     
     async def _handle_field_validation(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
-        """处理字段验证"""
-        field_name = event_data.get("field_name")
-        field_value = event_data.get("field_value")
+        """处理字段验证；携带 form_data 时对整个表单批量校验"""
+        component_id = event_data.get("component_id")
+        plan = self.validation_plans.get(component_id)
+        
+        if "form_data" in event_data:
+            field_errors = plan.validate(event_data["form_data"]) if plan else {}
+            return {
+                "component_id": component_id,
+                "is_valid": not field_errors,
+                "field_errors": field_errors
+            }
         
-        # 实时验证逻辑
-        validation_result = {
+        field_name = event_data.get("field_name")
+        error_message = plan.validate_field(field_name, event_data.get("field_value")) if plan else None
+        return {
             "field_name": field_name,
-            "is_valid": True,
-            "error_message": None
+            "is_valid": error_message is None,
+            "error_message": error_message
         }
-        
-        if field_name == "email" and field_value and "@" not in field_value:
-            validation_result["is_valid"] = False
-            validation_result["error_message"] = "邮箱格式不正确"
-        
-        return validation_result
     
     async def _handle_row_selection(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
         """处理表格行选择"""
@@ -500,10 +2901,43 @@ class MUPServerV2:
         
         logger.info(f"按 {column} 列 {direction} 排序")
         
+        # 排序后回到第一页
+        return await self._query_table_window({**event_data, "page": 1})
+    
+    async def _handle_table_filter(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
+        """处理表格过滤与全局搜索"""
+        return await self._query_table_window({**event_data, "page": 1})
+    
+    async def _handle_table_page(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
+        """处理表格翻页"""
+        return await self._query_table_window(event_data)
+    
+    async def _query_table_window(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
+        """在服务端执行表格查询，返回新的数据窗口"""
+        table_id = event_data.get("component_id")
+        source = self.table_sources.get(table_id)
+        if source is None:
+            return {
+                "status": "error",
+                "message": f"表格 {table_id} 未绑定数据源"
+            }
+        
+        table = self.component_registry.get(table_id) or {}
+        default_page_size = table.get("props", {}).get("pagination", {}).get("page_size", 10)
+        try:
+            query = TableQuery.from_event(event_data, default_page_size)
+            rows, total_count = await source.query(query)
+        except (ValueError, TypeError) as e:
+            return {"status": "error", "message": f"表格查询无效: {e}"}
+        
         return {
             "status": "success",
-            "sort_column": column,
-            "sort_direction": direction
+            "component_id": table_id,
+            "table_window": {
+                "rows": rows,
+                "total_count": total_count,
+                **query.to_dict()
+            }
         }
     
     async def _handle_notification_close(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -511,8 +2945,7 @@ class MUPServerV2:
         notification_id = event_data.get("component_id")
         
         # 从组件注册表中移除通知
-        if notification_id in self.component_registry:
-            del self.component_registry[notification_id]
+        self.component_registry.remove(notification_id)
         
         return {
             "status": "success",
@@ -520,64 +2953,451 @@ class MUPServerV2:
             "action": "removed"
         }
     
+    def _negotiate_compression(self, requested: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """按客户端偏好选择压缩算法；客户端字典版本不一致时随响应下发字典"""
+        for algorithm in requested.get("algorithms", []):
+            if algorithm == "deflate-dict":
+                negotiated = {
+                    "algorithm": algorithm,
+                    "dictionary_id": self.compression_dictionary_id,
+                    "level": self.compression_level
+                }
+                if requested.get("dictionary_id") != self.compression_dictionary_id:
+                    negotiated["dictionary"] = self.compression_dictionary.decode("utf-8")
+                return negotiated
+            if algorithm == "deflate":
+                return {"algorithm": algorithm, "level": self.compression_level}
+        return None
+    
+    def _frame_format(self, websocket) -> tuple:
+        """连接的帧格式：(编码, 压缩字典或 None, 是否压缩)"""
+        codec = self.connection_codecs.get(websocket, WireCodec.JSON)
+        compressor = self.connection_compressors.get(websocket)
+        if compressor is None:
+            return (codec, None, False)
+        return (codec, compressor.dictionary, True)
+    
+    def _encode_broadcast(self, message: MUPMessage, frame_format: tuple):
+        """广播帧编码；压缩连接使用无状态帧，以便多个连接共享同一份字节"""
+        codec, dictionary, compressed = frame_format
+        frame = message.encode(codec)
+        if compressed:
+            frame = FrameCompressor.compress_stateless(frame, dictionary, self.compression_level)
+        return frame
+    
+    def publish_component(self, topic: str, component: Dict[str, Any]) -> Dict[str, int]:
+        """更新注册表中的组件并广播给主题的所有订阅者"""
+        version = self.component_registry.set(component["id"], component)
+        message = MUPMessage(
+            MessageType.COMPONENT_UPDATE,
+            {
+                "topic": topic,
+                "update_type": "full",
+                "registry_version": version,
+                "component": component
+            }
+        )
+        if self.cluster is not None:
+            self.cluster.send("publish", topic=topic, message=message.to_json())
+        return self._deliver_broadcast(topic, message)
+    
+    def _deliver_broadcast(self, topic: str, message: MUPMessage) -> Dict[str, int]:
+        """向本进程内的订阅者广播，并记入各自会话的重放日志"""
+        for websocket in self.broadcast_hub.topics.get(topic, ()):
+            self._record_update(websocket, message)
+        return self.broadcast_hub.publish(topic, message)
+    
+    def _supersede_pending(self, websocket, message: MUPMessage):
+        queue = self.outbound_queues.get(websocket)
+        if queue is not None:
+            queue.discard(message)
+    
+    def _replay_log(self, session_id: str) -> ReplayLog:
+        log = self.replay_logs.get(session_id)
+        if log is None:
+            log = self.replay_logs[session_id] = ReplayLog()
+            if len(self.replay_logs) > self.max_replay_sessions:
+                self.replay_logs.popitem(last=False)
+        else:
+            self.replay_logs.move_to_end(session_id)
+        return log
+    
+    def _record_update(self, websocket, message: MUPMessage):
+        """把发往连接的组件更新记入其会话的重放日志"""
+        session_id = self.connection_sessions.get(websocket)
+        if session_id is not None:
+            self._replay_log(session_id).append(message)
+    
+    @staticmethod
+    def _hash_resume_token(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+    
+    @classmethod
+    def _check_resume_token(cls, expected_hash: Optional[str], token: Any) -> bool:
+        if not expected_hash or not isinstance(token, str):
+            return False
+        return hmac.compare_digest(expected_hash, cls._hash_resume_token(token))
+    
+    async def _handle_context_transfer(self, websocket, message: MUPMessage) -> MUPMessage:
+        """把之前的会话（上下文、订阅）转移到当前连接，用于重连后恢复"""
+        client_id = self.clients.client_id_for(websocket)
+        if client_id is None:
+            return MUPMessage(MessageType.ERROR, {"error_code": "MUP_UNAUTHORIZED", "error": "请先完成握手"})
+        session_id = message.payload.get("session_id")
+        record = await self.state.get(f"session:{session_id}") if session_id else None
+        if record is None:
+            return MUPMessage(MessageType.ERROR, {"error_code": "MUP_NOT_FOUND", "error": f"会话 {session_id} 不存在"})
+        security = self.security_contexts[client_id]
+        if (record["security"]["user_id"] != security.user_id
+                or not self._check_resume_token(record.get("resume_token_hash"),
+                                                message.payload.get("resume_token"))):
+            return MUPMessage(MessageType.ERROR, {"error_code": "MUP_FORBIDDEN", "error": "无权接管该会话"})
+        
+        security.session_id = session_id
+        self.connection_sessions[websocket] = session_id
+        session = self.clients[client_id]
+        # 接管后沿用原会话的恢复令牌
+        session["resume_token_hash"] = record["resume_token_hash"]
+        session["context"] = {**record["context"], **session["context"], "session_id": session_id}
+        subscriptions = record["context"].get("subscriptions", [])
+        for topic in subscriptions:
+            self.broadcast_hub.subscribe(topic, websocket)
+        self._persist_session(client_id)
+        
+        log = self.replay_logs.get(session_id)
+        return MUPMessage(MessageType.CONTEXT_TRANSFER, {
+            "session_id": session_id,
+            "status": "transferred",
+            "context": session["context"],
+            "subscriptions": subscriptions,
+            "last_message_id": log.last_message_id if log else None
+        })
+    
+    async def _handle_state_sync(self, websocket, message: MUPMessage) -> MUPMessage:
+        """按客户端最后应用的 message_id 回放错过的更新；日志不足时返回完整快照"""
+        session_id = self.connection_sessions.get(websocket)
+        if session_id is None:
+            return MUPMessage(MessageType.ERROR, {"error_code": "MUP_UNAUTHORIZED", "error": "请先完成握手"})
+        if message.payload.get("session_id", session_id) != session_id:
+            return MUPMessage(MessageType.ERROR, {
+                "error_code": "MUP_FORBIDDEN",
+                "error": "会话未绑定到当前连接，请先发送 context_transfer"
+            })
+        session = self.clients.get(self.clients.client_id_for(websocket)) or {}
+        if not self._check_resume_token(session.get("resume_token_hash"),
+                                        message.payload.get("resume_token")):
+            return MUPMessage(MessageType.ERROR, {"error_code": "MUP_FORBIDDEN", "error": "恢复令牌无效"})
+        
+        log = self.replay_logs.get(session_id)
+        missed = log.since(message.payload.get("last_message_id")) if log else None
+        if missed is not None:
+            return MUPMessage(MessageType.STATE_SYNC, {
+                "session_id": session_id,
+                "mode": "delta",
+                "messages": [m.to_dict() for m in missed],
+                "last_message_id": log.last_message_id
+            })
+        return MUPMessage(MessageType.STATE_SYNC, {
+            "session_id": session_id,
+            "mode": "snapshot",
+            "registry_version": self.component_registry.version,
+            "components": list(self.component_registry.snapshot().values()),
+            "last_message_id": log.last_message_id if log else None
+        })
+    
+    async def _session_exists(self, session_id: str) -> bool:
+        if session_id in self.replay_logs or session_id in self.connection_sessions.values():
+            return True
+        return await self.state.get(f"session:{session_id}") is not None
+    
+    def _persist_session(self, client_id: str, **extra: Any):
+        """把会话与安全上下文写入外部存储（延迟批量写回）"""
+        session = self.clients.get(client_id)
+        security = self.security_contexts.get(client_id)
+        if session is None or security is None:
+            return
+        self.state.put(f"session:{security.session_id}", {
+            "client_id": client_id,
+            "info": session["info"],
+            "context": session["context"],
+            "connected_at": session["connected_at"].isoformat() + "Z",
+            "codec": session["codec"].value,
+            "security": asdict(security),
+            "resume_token_hash": session.get("resume_token_hash"),
+            **extra
+        })
+    
+    async def _sweep_sessions(self):
+        """定期清除过期的会话记录（启动时先清理一次上次运行遗留的记录）"""
+        while True:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.session_ttl)
+            try:
+                records = await self.state.scan("session:")
+            except Exception as e:
+                logger.error(f"扫描会话记录失败: {e}")
+                records = {}
+            live = set(self.connection_sessions.values())
+            expired = 0
+            for key, record in records.items():
+                if key[len("session:"):] in live:
+                    continue
+                # 未记录断开时间的是上次运行时仍在线的会话，按连接时间计算；
+                # 多进程模式下它可能仍在其他工作进程上在线，只按断开时间清除
+                seen = record.get("disconnected_at")
+                if seen is None and self.cluster is None:
+                    seen = record.get("connected_at")
+                if seen and datetime.fromisoformat(seen.rstrip("Z")) < cutoff:
+                    self.state.delete(key)
+                    expired += 1
+            if expired:
+                logger.info(f"已清除 {expired} 条过期会话记录")
+            await asyncio.sleep(min(self.session_ttl, 300))
+    
+    def _persist_registry_change(self, version: int, changed_ids: List[str]):
+        # 从存储恢复或由其他工作进程同步的变更已在存储中，不重复写入
+        if self._applying_remote:
+            return
+        for component_id in changed_ids:
+            self.state.put(f"component:{component_id}", self.component_registry.get(component_id))
+    
+    async def _restore_components(self):
+        """启动时从外部存储恢复组件注册表"""
+        stored = await self.state.scan("component:")
+        if not stored:
+            return
+        self._applying_remote = True
+        try:
+            async with self.component_registry.transaction() as txn:
+                for key, component in stored.items():
+                    txn.set(key[len("component:"):], component)
+        finally:
+            self._applying_remote = False
+        logger.info(f"已从外部存储恢复 {len(stored)} 个组件")
+    
+    async def attach_cluster(self, cluster: ClusterBus):
+        """接入多进程集群：本地注册表变更转发给其他工作进程，并应用它们发来的变更"""
+        self.cluster = cluster
+        self.component_registry.subscribe(self._forward_registry_change)
+        await cluster.connect(self._on_cluster_message)
+    
+    def _forward_registry_change(self, version: int, changed_ids: List[str]):
+        if self._applying_remote or self.cluster is None:
+            return
+        for component_id in changed_ids:
+            self.cluster.send("registry", component_id=component_id,
+                              component=self.component_registry.get(component_id))
+    
+    def _on_cluster_message(self, message: Dict[str, Any]):
+        """应用其他工作进程的注册表变更或在本进程内投递其广播"""
+        kind = message.get("kind")
+        if kind == "registry":
+            self._applying_remote = True
+            try:
+                if message.get("component") is None:
+                    self.component_registry.remove(message["component_id"])
+                else:
+                    self.component_registry.set(message["component_id"], message["component"])
+            finally:
+                self._applying_remote = False
+        elif kind == "publish":
+            self._deliver_broadcast(message["topic"], MUPMessage.from_json(message["message"]))
+    
+    def _apply_templates(self, websocket, message: MUPMessage) -> tuple:
+        """将消息中的组件替换为模板引用，返回 (新消息, 需要先注册的模板)"""
+        known = self.client_templates.get(websocket)
+        if known is None or message.message_type != MessageType.COMPONENT_UPDATE:
+            return message, {}
+        payload = message.payload
+        if "ui_updates" not in payload and "component" not in payload:
+            return message, {}
+        
+        now = time.monotonic()
+        new_templates: Dict[str, Dict[str, Any]] = {}
+        
+        def compact(component: Any) -> Any:
+            if not isinstance(component, dict):
+                return component
+            split = self.template_store.split(component)
+            if split is None:
+                return component
+            template_id, template, reference = split
+            if known.get(template_id, 0) <= now:
+                new_templates[template_id] = template
+                known[template_id] = now + self.template_store.ttl
+            return reference
+        
+        compacted = dict(payload)
+        if "ui_updates" in compacted:
+            compacted["ui_updates"] = [compact(c) for c in compacted["ui_updates"]]
+        if "component" in compacted:
+            compacted["component"] = compact(compacted["component"])
+        return MUPMessage(message.message_type, compacted, message.version, message.message_id), new_templates
+    
+    async def send_message(self, websocket, message: MUPMessage):
+        """按连接协商的编码发送消息；有出站队列时入队由写任务发送"""
+        if message.message_type == MessageType.COMPONENT_UPDATE:
+            self._record_update(websocket, message)
+        message, new_templates = self._apply_templates(websocket, message)
+        if new_templates:
+            # 模板注册必须先于引用它的消息到达，且不可被丢弃；
+            # 引用它的更新不能合并进队列中更靠前的旧槽位
+            await self._send_frame(websocket, MUPMessage(
+                MessageType.COMPONENT_UPDATE,
+                {
+                    "update_type": "template_registration",
+                    "templates": new_templates,
+                    "ttl": self.template_store.ttl
+                }
+            ), critical=True)
+        await self._send_frame(websocket, message, in_place=not new_templates)
+    
+    async def _send_frame(self, websocket, message: MUPMessage, critical: bool = False,
+                          in_place: bool = True):
+        codec = self.connection_codecs.get(websocket, WireCodec.JSON)
+        compressor = self.connection_compressors.get(websocket)
+        queue = self.outbound_queues.get(websocket)
+        if queue is None:
+            frame = message.encode(codec)
+            await websocket.send(compressor.compress(frame) if compressor else frame)
+        else:
+            queue.put(message, codec, compressor, critical=critical, in_place=in_place)
+    
+    @staticmethod
+    def ordering_key(message: MUPMessage) -> Any:
+        """消息排序键：事件按组件保持顺序，其余控制消息作为屏障串行执行"""
+        if message.message_type == MessageType.EVENT_NOTIFICATION:
+            return ("component", message.payload.get("component_id"))
+        return None
+    
     async def handle_client_message(self, websocket, 
-                                  message_str: str):
-        """处理客户端消息"""
+                                  message_str: str | bytes):
+        """解码并处理客户端消息"""
         try:
-            message = MUPMessage.from_json(message_str)
-            response = None
-            
-            if message.message_type == MessageType.HANDSHAKE_REQUEST:
-                response = await self._handle_handshake(websocket, message)
-            
-            elif message.message_type == MessageType.CAPABILITY_QUERY:
-                response = await self._handle_capability_query(websocket, message)
-            
-            elif message.message_type == MessageType.BATCH_OPERATION:
-                response = await self._handle_batch_operation(websocket, message)
+            message = MUPMessage.decode(message_str)
+        except Exception as e:
+            await self._send_internal_error(websocket, e)
+            return
+        await self.process_message(websocket, message)
+    
+    async def _send_internal_error(self, websocket, error: Exception):
+        logger.error(f"处理消息时出错: {error}")
+        error_response = MUPMessage(
+            MessageType.ERROR,
+            {"error": f"服务器内部错误: {str(error)}"}
+        )
+        await self.send_message(websocket, error_response)
+    
+    async def process_message(self, websocket, message: MUPMessage):
+        """处理已解码的客户端消息"""
+        try:
+            if message.message_type == MessageType.EVENT_NOTIFICATION:
+                route = self.router.lookup((message.message_type, message.payload.get("handler")))
+            else:
+                route = self.router.lookup(message.message_type)
             
-            elif message.message_type == MessageType.EVENT_NOTIFICATION:
-                # 处理事件通知
-                event_data = message.payload
-                handler_name = event_data.get("handler")
-                
-                if handler_name in self.event_handlers:
-                    result = await self.event_handlers[handler_name](event_data)
+            if route is not None:
+                try:
+                    response = await route(websocket, message)
+                except asyncio.TimeoutError:
                     response = MUPMessage(
-                        MessageType.COMPONENT_UPDATE,
-                        result
+                        MessageType.ERROR,
+                        {"error_code": "MUP_SERVICE_UNAVAILABLE", "error": f"处理器 {route.name} 超时"}
                     )
-                else:
+                except ExecutorBusyError as e:
                     response = MUPMessage(
                         MessageType.ERROR,
-                        {"error": f"未知的事件处理器: {handler_name}"}
+                        {"error_code": "MUP_SERVICE_UNAVAILABLE", "error": str(e)}
                     )
-            
+            elif message.message_type == MessageType.EVENT_NOTIFICATION:
+                response = MUPMessage(
+                    MessageType.ERROR,
+                    {
+                        "error_code": "MUP_NOT_FOUND",
+                        "error": f"未知的事件处理器: {message.payload.get('handler')}"
+                    }
+                )
             else:
                 response = MUPMessage(
                     MessageType.ERROR,
-                    {"error": f"不支持的消息类型: {message.message_type.value}"}
+                    {
+                        "error_code": "MUP_NOT_IMPLEMENTED",
+                        "error": f"不支持的消息类型: {message.message_type.value}"
+                    }
                 )
             
             if response:
-                await websocket.send(response.to_json())
+                await self.send_message(websocket, response)
+                if response.message_type == MessageType.HANDSHAKE_RESPONSE:
+                    # 握手响应始终使用未压缩的 JSON，之后的帧切换到协商的编码与压缩
+                    self.connection_codecs[websocket] = WireCodec(response.payload["codec"])
+                    compression = response.payload.get("compression")
+                    if compression:
+                        dictionary = self.compression_dictionary if compression.get("dictionary_id") else None
+                        self.connection_compressors[websocket] = FrameCompressor(
+                            dictionary, self.compression_level)
+                    else:
+                        self.connection_compressors.pop(websocket, None)
         
         except Exception as e:
-            logger.error(f"处理消息时出错: {e}")
-            error_response = MUPMessage(
-                MessageType.ERROR,
-                {"error": f"服务器内部错误: {str(e)}"}
-            )
-            await websocket.send(error_response.to_json())
+            await self._send_internal_error(websocket, e)
+    
+    async def _process_admitted(self, websocket, message: MUPMessage):
+        try:
+            await self.process_message(websocket, message)
+        finally:
+            self.admission.done(websocket)
     
     async def handle_client(self, websocket):
         """处理客户端连接"""
         client_address = websocket.remote_address
+        if not self.admission.connect(websocket):
+            logger.warning(f"连接数已达上限 {self.admission.max_clients}，拒绝 {client_address}")
+            await websocket.send(MUPMessage(MessageType.ERROR, {
+                "error_code": "MUP_SERVICE_UNAVAILABLE",
+                "error": "服务器连接数已达上限",
+                "retry_after_ms": 5000
+            }).to_json())
+            await websocket.close(1013, "server at capacity")
+            return
         logger.info(f"新客户端连接: {client_address}")
+        pipeline = MessagePipeline(self.max_in_flight_per_connection)
+        queue = OutboundQueue(websocket)
+        self.outbound_queues[websocket] = queue
+        queue.start()
         
         try:
-            async for message in websocket:
-                await self.handle_client_message(websocket, message)
+            async for frame in websocket:
+                # 准入控制在解码前完成，被拒绝的帧不做任何解析与处理
+                sniffed, rejection = self.admission.admit(websocket, frame)
+                if rejection is not None:
+                    if self.admission.is_abusive(websocket):
+                        logger.warning(f"客户端 {client_address} 持续超限，断开连接")
+                        await websocket.close(1008, "rate limit exceeded")
+                        break
+                    if self.admission.should_notify(websocket):
+                        await self._send_frame(websocket, MUPMessage(MessageType.ERROR, rejection))
+                    continue
+                # 出站积压过高时暂停读取，直到客户端消化
+                await queue.writable()
+                if queue.closed:
+                    break
+                try:
+                    message = MUPMessage.decode(frame)
+                except Exception as e:
+                    self.admission.done(websocket)
+                    await self._send_internal_error(websocket, e)
+                    continue
+                rejection = self.admission.verify(websocket, sniffed, message.message_type.value)
+                if rejection is not None:
+                    if self.admission.should_notify(websocket):
+                        await self._send_frame(websocket, MUPMessage(MessageType.ERROR, rejection))
+                    continue
+                # 在途消息满时在此等待，暂停读取 socket 形成背压
+                await pipeline.submit(
+                    self.ordering_key(message),
+                    lambda message=message: self._process_admitted(websocket, message)
+                )
+            await pipeline.drain()
         
         except websockets.exceptions.ConnectionClosed:
             logger.info(f"客户端 {client_address} 断开连接")
@@ -586,31 +3406,61 @@ class MUPServerV2:
             logger.error(f"客户端连接错误: {e}")
         
         finally:
+            await pipeline.cancel()
+            self.admission.disconnect(websocket)
+            await queue.close()
+            self.outbound_queues.pop(websocket, None)
+            logger.debug(f"客户端 {client_address} 出站统计: {queue.stats}")
             # 清理客户端数据
-            client_id = None
-            for cid, client_data in self.clients.items():
-                if client_data["websocket"] == websocket:
-                    client_id = cid
-                    break
+            self.connection_codecs.pop(websocket, None)
+            self.connection_compressors.pop(websocket, None)
+            self.client_templates.pop(websocket, None)
+            self.connection_sessions.pop(websocket, None)
+            self.batch_executor.release_client(websocket)
+            self.broadcast_hub.remove_connection(websocket)
+            client_id = self.clients.client_id_for(websocket)
+            if client_id:
+                self._persist_session(client_id, disconnected_at=datetime.utcnow().isoformat() + "Z")
+            self.clients.remove_connection(websocket)
             
             if client_id:
-                del self.clients[client_id]
-                if client_id in self.security_contexts:
-                    del self.security_contexts[client_id]
+                self.security_contexts.pop(client_id, None)
                 logger.info(f"已清理客户端 {client_id} 的数据")
     
-    async def start_server(self):
-        """启动服务器"""
+    async def start_server(self, reuse_port: bool = False, cluster: Optional[ClusterBus] = None):
+        """启动服务器；多进程模式下以 SO_REUSEPORT 共享端口并接入集群 IPC"""
         logger.info(f"启动 MUP Server v2.0 在 {self.host}:{self.port}")
         
-        # 创建示例组件
-        self._create_sample_components()
+        # 先恢复外部存储中的组件，再创建示例组件（每个工作进程各自创建，不在集群中转发）
+        await self._restore_components()
+        await self._create_sample_components()
+        if cluster is not None:
+            await self.attach_cluster(cluster)
+        sweeper = asyncio.create_task(self._sweep_sessions())
         
-        async with websockets.serve(self.handle_client, self.host, self.port):
-            logger.info(f"MUP Server v2.0 正在监听 ws://{self.host}:{self.port}")
-            await asyncio.Future()  # 保持服务器运行
+        loop = asyncio.get_running_loop()
+        serving = loop.create_future()
+        # 监督进程以 SIGTERM 停止工作进程：结束等待以执行下面的清理（写回存储、关闭执行器）；
+        # Windows 事件循环不支持信号处理器，此时只能以 Ctrl+C 停止
+        try:
+            loop.add_signal_handler(signal.SIGTERM, lambda: serving.done() or serving.set_result(None))
+            handles_sigterm = True
+        except NotImplementedError:
+            handles_sigterm = False
+        try:
+            async with websockets.serve(self.handle_client, self.host, self.port, reuse_port=reuse_port):
+                logger.info(f"MUP Server v2.0 正在监听 ws://{self.host}:{self.port} (pid={os.getpid()})")
+                await serving  # 保持服务器运行
+        finally:
+            if handles_sigterm:
+                loop.remove_signal_handler(signal.SIGTERM)
+            sweeper.cancel()
+            self.handler_executor.shutdown()
+            await self.state.close()
+            if self.cluster is not None:
+                await self.cluster.close()
     
-    def _create_sample_components(self):
+    async def _create_sample_components(self):
         """创建示例组件"""
         # 创建示例表单
         sample_form = ComponentBuilder.form(
@@ -646,7 +3496,8 @@ class MUPServerV2:
         )
         
         # 创建示例数据表格
-        sample_table = ComponentBuilder.data_table(
+        # 表格数据保留在服务端，客户端只收到当前页窗口
+        sample_table = await self.create_paged_table(
             "sample_table",
             [
                 {"key": "id", "title": "ID", "sortable": True},
@@ -654,19 +3505,29 @@ class MUPServerV2:
                 {"key": "email", "title": "邮箱", "sortable": True},
                 {"key": "created_at", "title": "创建时间", "sortable": True}
             ],
-            [
+            ListDataSource([
                 {"id": 1, "name": "张三", "email": "zhang@example.com", "created_at": "2024-01-01"},
                 {"id": 2, "name": "李四", "email": "li@example.com", "created_at": "2024-01-02"},
                 {"id": 3, "name": "王五", "email": "wang@example.com", "created_at": "2024-01-03"}
-            ]
+            ])
         )
         
         # 注册组件
-        self.component_registry["sample_form"] = sample_form
-        self.component_registry["sample_table"] = sample_table
+        self.component_registry.set("sample_form", sample_form)
+        self.component_registry.set("sample_table", sample_table)
         
         logger.info("已创建示例组件")
 
 if __name__ == "__main__":
-    server = MUPServerV2()
-    asyncio.run(server.start_server())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="MUP Server v2.0")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="工作进程数；大于 1 时以 SO_REUSEPORT 多进程模式运行（0 表示 CPU 核数）")
+    args = parser.parse_args()
+    
+    if args.workers == 1:
+        server = MUPServerV2(args.host, args.port)
+        asyncio.run(server.start_server())
+    else:
+        asyncio.run(WorkerSupervisor(args.host, args.port, args.workers or None).run())
\ No newline at end of file
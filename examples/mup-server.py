@@ -8,6 +8,7 @@ pip install websockets
 """
 
 import json
+import re
 import asyncio
 try:
     import websockets
@@ -15,36 +16,93 @@ except ImportError:
     print("请安装websockets: pip install websockets")
     exit(1)
 import uuid
+import copy
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict, deque
 from datetime import datetime
-from typing import Dict, List, Any, Optional
-from dataclasses import dataclass, asdict
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Iterator, AsyncIterator, Awaitable, Callable
 from abc import ABC, abstractmethod
 
 
-@dataclass
+@lru_cache(maxsize=4096)
+def _iso_millis(millis: int) -> str:
+    """毫秒时间戳格式化为 ISO 8601（同一毫秒内创建的组件共享格式化结果）"""
+    return datetime.fromtimestamp(millis / 1000).isoformat(timespec="milliseconds")
+
+
 class MUPComponent:
-    """MUP组件数据类"""
-    id: str
-    type: str
-    version: str = "1.0.0"
-    props: Optional[Dict[str, Any]] = None
-    children: Optional[List['MUPComponent']] = None
-    events: Optional[Dict[str, Dict[str, Any]]] = None
-    metadata: Optional[Dict[str, Any]] = None
-    
-    def __post_init__(self):
-        if self.props is None:
-            self.props = {}
-        if self.children is None:
-            self.children = []
-        if self.events is None:
-            self.events = {}
-        if self.metadata is None:
-            self.metadata = {
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat(),
-                "source": "mup-server"
-            }
+    """MUP组件（紧凑表示）
+    
+    使用 __slots__ 存储；未设置的 props/events/children 不分配容器，
+    首次访问时才创建；元数据只记录创建时间戳，需要时再生成字典。
+    """
+    
+    __slots__ = ("id", "type", "version", "_props", "_children", "_events", "_metadata", "_created_ms")
+    
+    def __init__(self, id: str, type: str, version: str = "1.0.0",
+                 props: Optional[Dict[str, Any]] = None,
+                 children: Optional[List['MUPComponent']] = None,
+                 events: Optional[Dict[str, Dict[str, Any]]] = None,
+                 metadata: Optional[Dict[str, Any]] = None):
+        self.id = id
+        self.type = type
+        self.version = version
+        self._props = props
+        self._children = children
+        self._events = events
+        self._metadata = metadata
+        self._created_ms = time.time_ns() // 1_000_000 if metadata is None else 0
+    
+    @property
+    def props(self) -> Dict[str, Any]:
+        if self._props is None:
+            self._props = {}
+        return self._props
+    
+    @props.setter
+    def props(self, value: Optional[Dict[str, Any]]):
+        self._props = value
+    
+    @property
+    def children(self) -> List['MUPComponent']:
+        if self._children is None:
+            self._children = []
+        return self._children
+    
+    @children.setter
+    def children(self, value: Optional[List['MUPComponent']]):
+        self._children = value
+    
+    @property
+    def events(self) -> Dict[str, Dict[str, Any]]:
+        if self._events is None:
+            self._events = {}
+        return self._events
+    
+    @events.setter
+    def events(self, value: Optional[Dict[str, Dict[str, Any]]]):
+        self._events = value
+    
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        if self._metadata is None:
+            self._metadata = self._default_metadata()
+        return self._metadata
+    
+    @metadata.setter
+    def metadata(self, value: Optional[Dict[str, Any]]):
+        self._metadata = value
+    
+    def _default_metadata(self) -> Dict[str, Any]:
+        timestamp = _iso_millis(self._created_ms)
+        return {
+            "created_at": timestamp,
+            "updated_at": timestamp,
+            "source": "mup-server"
+        }
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式"""
@@ -52,15 +110,233 @@ class MUPComponent:
             "id": self.id,
             "type": self.type,
             "version": self.version,
-            "props": self.props,
-            "events": self.events,
-            "metadata": self.metadata
+            "props": self._props if self._props is not None else {},
+            "events": self._events if self._events is not None else {},
+            "metadata": self._metadata if self._metadata is not None else self._default_metadata()
         }
         
-        if self.children:
-            result["children"] = [child.to_dict() for child in self.children]
+        if self._children:
+            result["children"] = [child.to_dict() for child in self._children]
         
         return result
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """与 to_dict() 相同，但属性字典被深拷贝，之后修改组件不影响快照"""
+        result = {
+            "id": self.id,
+            "type": self.type,
+            "version": self.version,
+            "props": copy.deepcopy(self._props) if self._props is not None else {},
+            "events": copy.deepcopy(self._events) if self._events is not None else {},
+            "metadata": (copy.deepcopy(self._metadata) if self._metadata is not None
+                         else self._default_metadata())
+        }
+        if self._children:
+            result["children"] = [child.snapshot() for child in self._children]
+        return result
+    
+    def iter_json(self) -> Iterator[str]:
+        """逐节点生成 JSON 片段，拼接结果与 json.dumps(self.to_dict()) 相同
+        
+        编码过程不构建整棵树的字典或完整字符串，额外内存只与树深度和单个节点大小相关。
+        """
+        yield (f'{{"id": {json.dumps(self.id)}, "type": {json.dumps(self.type)}, '
+               f'"version": {json.dumps(self.version)}, '
+               f'"props": {json.dumps(self._props if self._props is not None else {})}, '
+               f'"events": {json.dumps(self._events if self._events is not None else {})}, '
+               f'"metadata": {json.dumps(self._metadata if self._metadata is not None else self._default_metadata())}')
+        if self._children:
+            yield ', "children": ['
+            for index, child in enumerate(self._children):
+                if index:
+                    yield ', '
+                yield from child.iter_json()
+            yield ']'
+        yield '}'
+    
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, MUPComponent):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+    
+    def __repr__(self) -> str:
+        return f"MUPComponent(id={self.id!r}, type={self.type!r}, children={len(self._children or ())})"
+
+
+STREAM_PLACEHOLDER = "__mup_stream_root__"
+
+
+def iter_message_chunks(envelope: Dict[str, Any], component: MUPComponent,
+                        chunk_size: int = 16 * 1024) -> Iterator[str]:
+    """流式编码消息：envelope 中值为 STREAM_PLACEHOLDER 的位置替换为组件树，
+    小片段合并为约 chunk_size 字符的块，每块作为一个 WebSocket 分片发送"""
+    prefix, suffix = json.dumps(envelope).split(json.dumps(STREAM_PLACEHOLDER), 1)
+    buffer: List[str] = [prefix]
+    size = len(prefix)
+    for fragment in component.iter_json():
+        buffer.append(fragment)
+        size += len(fragment)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    buffer.append(suffix)
+    yield "".join(buffer)
+
+
+async def send_chunks(websocket, chunks: Iterator[str]):
+    """只有一个块时按普通消息发送，否则使用 WebSocket 分片发送"""
+    first = next(chunks)
+    second = next(chunks, None)
+    if second is None:
+        await websocket.send(first)
+    else:
+        await websocket.send(itertools.chain((first, second), chunks))
+
+
+class ComponentTreeDiffer:
+    """组件树差异计算（RFC 6902 风格，对应规范 §6.2 incremental_update）"""
+    
+    # 每次重建组件都会变化的元数据字段，不参与比较
+    VOLATILE_METADATA = ("created_at", "updated_at")
+    NODE_FIELDS = ("version", "props", "events", "metadata")
+    
+    @classmethod
+    def diff(cls, old: Dict[str, Any], new: Dict[str, Any], path: str = "/root") -> List[Dict[str, Any]]:
+        """计算将 old 组件树变为 new 组件树的操作列表"""
+        operations: List[Dict[str, Any]] = []
+        cls._diff_node(old, new, path, operations)
+        return operations
+    
+    @classmethod
+    def _diff_node(cls, old: Dict[str, Any], new: Dict[str, Any], path: str,
+                   operations: List[Dict[str, Any]]):
+        """比较两个节点；id 或类型不同时整体替换"""
+        if old.get("id") != new.get("id") or old.get("type") != new.get("type"):
+            operations.append({"op": "replace", "path": path, "value": new})
+            return
+        
+        for key in cls.NODE_FIELDS:
+            old_value, new_value = old.get(key), new.get(key)
+            if key == "metadata":
+                old_value = cls._stable_metadata(old_value)
+                new_value = cls._stable_metadata(new_value)
+            if old_value == new_value:
+                continue
+            if isinstance(old_value, dict) and isinstance(new_value, dict):
+                cls._diff_mapping(old.get(key), new.get(key), old_value, new_value,
+                                  f"{path}/{key}", operations)
+            elif key not in new:
+                operations.append({"op": "remove", "path": f"{path}/{key}"})
+            else:
+                op = "replace" if key in old else "add"
+                operations.append({"op": op, "path": f"{path}/{key}", "value": new[key]})
+        
+        old_children = old.get("children") or []
+        new_children = new.get("children") or []
+        if not old_children and new_children:
+            operations.append({"op": "add", "path": f"{path}/children", "value": new_children})
+        elif old_children and not new_children:
+            operations.append({"op": "remove", "path": f"{path}/children"})
+        elif old_children != new_children:
+            cls._diff_children(old_children, new_children, f"{path}/children", operations)
+    
+    @classmethod
+    def _diff_mapping(cls, old_full: Dict[str, Any], new_full: Dict[str, Any],
+                      old_cmp: Dict[str, Any], new_cmp: Dict[str, Any], path: str,
+                      operations: List[Dict[str, Any]]):
+        """逐键比较属性字典；old_cmp/new_cmp 为去除易变字段后的比较视图"""
+        for key in old_cmp:
+            if key not in new_cmp:
+                operations.append({"op": "remove", "path": f"{path}/{cls._escape(key)}"})
+        for key, value in new_cmp.items():
+            if key not in old_cmp:
+                operations.append({"op": "add", "path": f"{path}/{cls._escape(key)}", "value": new_full[key]})
+            elif old_cmp[key] != value:
+                operations.append({"op": "replace", "path": f"{path}/{cls._escape(key)}", "value": new_full[key]})
+    
+    @classmethod
+    def _diff_children(cls, old_children: List[Dict[str, Any]], new_children: List[Dict[str, Any]],
+                       path: str, operations: List[Dict[str, Any]]):
+        """按组件 id 对齐子节点，生成 remove/move/add 并递归比较"""
+        new_ids = {child.get("id") for child in new_children}
+        working = list(old_children)
+        
+        # 先从后往前移除已不存在的子节点，避免索引偏移
+        for index in range(len(working) - 1, -1, -1):
+            if working[index].get("id") not in new_ids:
+                operations.append({"op": "remove", "path": f"{path}/{index}"})
+                del working[index]
+        
+        for index, child in enumerate(new_children):
+            child_id = child.get("id")
+            current = working[index] if index < len(working) else None
+            if current is not None and current.get("id") == child_id:
+                cls._diff_node(current, child, f"{path}/{index}", operations)
+                continue
+            
+            source = next((i for i in range(index + 1, len(working))
+                           if working[i].get("id") == child_id), None)
+            if source is None:
+                operations.append({"op": "add", "path": f"{path}/{index}", "value": child})
+                working.insert(index, child)
+            else:
+                operations.append({"op": "move", "from": f"{path}/{source}", "path": f"{path}/{index}"})
+                working.insert(index, working.pop(source))
+                cls._diff_node(working[index], child, f"{path}/{index}", operations)
+    
+    @classmethod
+    def apply(cls, tree: Dict[str, Any], operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """将操作列表应用到组件树副本上（用于校验与客户端状态重建）"""
+        document = {"root": copy.deepcopy(tree)}
+        for operation in operations:
+            op = operation["op"]
+            if op == "move":
+                parent, key = cls._resolve(document, operation["from"])
+                value = parent.pop(key)
+                cls._insert(document, operation["path"], value)
+            elif op == "add":
+                cls._insert(document, operation["path"], copy.deepcopy(operation["value"]))
+            elif op == "remove":
+                parent, key = cls._resolve(document, operation["path"])
+                del parent[key]
+            elif op == "replace":
+                parent, key = cls._resolve(document, operation["path"])
+                parent[key] = copy.deepcopy(operation["value"])
+            else:
+                raise ValueError(f"不支持的增量操作: {op}")
+        return document["root"]
+    
+    @classmethod
+    def _insert(cls, document: Dict[str, Any], path: str, value: Any):
+        parent, key = cls._resolve(document, path)
+        if isinstance(parent, list):
+            parent.insert(key, value)
+        else:
+            parent[key] = value
+    
+    @classmethod
+    def _resolve(cls, document: Dict[str, Any], path: str):
+        """解析 JSON Pointer，返回 (父容器, 键)"""
+        parts = [cls._unescape(part) for part in path.lstrip("/").split("/")]
+        target: Any = document
+        for part in parts[:-1]:
+            target = target[int(part)] if isinstance(target, list) else target[part]
+        last = parts[-1]
+        return target, int(last) if isinstance(target, list) else last
+    
+    @classmethod
+    def _stable_metadata(cls, metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not isinstance(metadata, dict):
+            return metadata
+        return {k: v for k, v in metadata.items() if k not in cls.VOLATILE_METADATA}
+    
+    @staticmethod
+    def _escape(key: str) -> str:
+        return str(key).replace("~", "~0").replace("/", "~1")
+    
+    @staticmethod
+    def _unescape(part: str) -> str:
+        return part.replace("~1", "/").replace("~0", "~")
 
 
 class ComponentBuilder:
@@ -137,79 +413,137 @@ class ComponentBuilder:
 
 
 class EventHandler(ABC):
-    """事件处理器基类"""
+    """事件处理器基类
+    
+    execution 声明执行类别："inline" 在事件循环中 await handle()；
+    "thread"/"process" 在有界线程池/进程池中调用同步的 handle_blocking()。
+    """
+    
+    execution = "inline"
     
     @abstractmethod
     async def handle(self, event_data: Dict[str, Any], context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """处理事件"""
         pass
+    
+    def handle_blocking(self, event_data: Dict[str, Any], context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """阻塞版本的事件处理，在执行器中运行"""
+        raise NotImplementedError(f"{type(self).__name__} 不支持在执行器中运行")
 
 
-class FormValidationHandler(EventHandler):
-    """表单验证处理器"""
+EMAIL_PATTERN = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+
+
+class ValidationPlan:
+    """组件树的校验计划：输入组件 props 中声明的 required/validation 规则
+    一次性编译为预编译的检查列表，按键校验时不再解析规则或正则"""
     
-    async def handle(self, event_data: Dict[str, Any], context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        component_id = event_data.get("component_id")
-        value = event_data.get("value", "")
-        
-        # 根据组件ID进行不同的验证
-        if component_id and "name" in component_id:
-            return self.validate_name(value)
-        elif component_id and "email" in component_id:
-            return self.validate_email(value)
-        elif component_id and "password" in component_id:
-            return self.validate_password(value)
-        
-        return None
+    def __init__(self, fields: Dict[str, tuple]):
+        # 组件 ID -> (是否必填, ((检查函数, 错误信息), ...))
+        self.fields = fields
     
-    def validate_name(self, value: str) -> Dict[str, Any]:
-        """验证姓名"""
-        if len(value) < 2:
-            return {
-                "valid": False,
-                "message": "姓名至少需要2个字符"
-            }
-        elif len(value) > 50:
-            return {
-                "valid": False,
-                "message": "姓名不能超过50个字符"
-            }
-        return {"valid": True}
+    @classmethod
+    def compile(cls, root: MUPComponent) -> 'ValidationPlan':
+        fields = {}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.type == "input" and node._props:
+                fields[node.id] = cls._compile_input(node._props)
+            if node._children:
+                stack.extend(reversed(node._children))
+        return cls(fields)
     
-    def validate_email(self, value: str) -> Dict[str, Any]:
-        """验证邮箱"""
-        import re
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(pattern, value):
-            return {
-                "valid": False,
-                "message": "请输入有效的邮箱地址"
-            }
-        return {"valid": True}
+    @staticmethod
+    def _compile_input(props: Dict[str, Any]) -> tuple:
+        rule = props.get("validation") or {}
+        message = rule.get("error_message")
+        checks = []
+        if "min_length" in rule:
+            minimum = rule["min_length"]
+            checks.append((lambda v, n=minimum: len(v) >= n, message or f"至少需要{minimum}个字符"))
+        if "max_length" in rule:
+            maximum = rule["max_length"]
+            checks.append((lambda v, n=maximum: len(v) <= n, message or f"不能超过{maximum}个字符"))
+        is_email = props.get("input_type") == "email"
+        pattern = rule.get("pattern") or (EMAIL_PATTERN if is_email else None)
+        if pattern:
+            checks.append((re.compile(pattern).match, message or ("请输入有效的邮箱地址" if is_email else "格式不正确")))
+        return bool(props.get("required")), tuple(checks)
     
-    def validate_password(self, value: str) -> Dict[str, Any]:
-        """验证密码"""
-        import re
-        if len(value) < 8:
-            return {
-                "valid": False,
-                "message": "密码至少需要8个字符"
-            }
-        
-        pattern = r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)[a-zA-Z\d@$!%*?&]{8,}$'
-        if not re.match(pattern, value):
-            return {
-                "valid": False,
-                "message": "密码必须包含大小写字母和数字"
-            }
-        
+    def validate_field(self, component_id: str, value: Any) -> Optional[Dict[str, Any]]:
+        """校验单个输入组件；组件没有声明规则时返回 None"""
+        compiled = self.fields.get(component_id)
+        if compiled is None:
+            return None
+        required, checks = compiled
+        if value is None or value == "":
+            return {"valid": False, "message": "此字段为必填项"} if required else {"valid": True}
+        text = value if isinstance(value, str) else str(value)
+        for check, message in checks:
+            if not check(text):
+                return {"valid": False, "message": message}
         return {"valid": True}
+    
+    def validate(self, values: Dict[str, Any]) -> Dict[str, str]:
+        """整表校验，返回 {组件ID: 错误信息}"""
+        errors = {}
+        for component_id in self.fields:
+            result = self.validate_field(component_id, values.get(component_id))
+            if not result["valid"]:
+                errors[component_id] = result["message"]
+        return errors
+
+
+class FormValidationHandler(EventHandler):
+    """表单验证处理器
+    
+    校验规则来自客户端当前组件树中输入组件声明的 validation 属性；
+    编译结果按客户端缓存，组件树版本变化时重新编译。
+    """
+    
+    def __init__(self):
+        self._plans: Dict[str, tuple] = {}
+    
+    def plan_for(self, context: Dict[str, Any]) -> Optional[ValidationPlan]:
+        """取得（必要时编译）context 中组件树对应的校验计划"""
+        client_id = context.get("client_id")
+        tree = context.get("component_tree")
+        if tree is None:
+            return None
+        version = context.get("tree_version")
+        cached = self._plans.get(client_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        plan = ValidationPlan.compile(tree)
+        self._plans[client_id] = (version, plan)
+        return plan
+    
+    def discard(self, client_id: str):
+        """客户端断开时丢弃缓存的校验计划"""
+        self._plans.pop(client_id, None)
+    
+    async def handle(self, event_data: Dict[str, Any], context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        plan = self.plan_for(context)
+        if plan is None:
+            return None
+        return plan.validate_field(event_data.get("component_id"), event_data.get("value", ""))
+    
+    def validate_form(self, values: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, str]:
+        """整表批量校验，返回 {组件ID: 错误信息}"""
+        plan = self.plan_for(context)
+        return plan.validate(values) if plan else {}
 
 
 class SubmitHandler(EventHandler):
-    """提交处理器"""
+    """提交处理器（保存数据库、发送邮件等阻塞操作，默认在线程池中运行）"""
+    
+    execution = "thread"
     
     async def handle(self, event_data: Dict[str, Any], context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return self.handle_blocking(event_data, context)
+    
+    def handle_blocking(self, event_data: Dict[str, Any], context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         print(f"处理表单提交: {event_data}")
         
         # 这里可以添加实际的业务逻辑
@@ -222,30 +556,374 @@ class SubmitHandler(EventHandler):
         }
 
 
+class ExecutorBusyError(Exception):
+    """执行器排队已满"""
+    pass
+
+
+def _timed_call(fn, *args) -> tuple:
+    """在工作线程/进程中执行，返回 (开始执行的墙钟时间, 结果) 用于计算排队时间"""
+    return time.time(), fn(*args)
+
+
+class HandlerExecutor:
+    """把阻塞或 CPU 密集型处理器分流到有界线程池/进程池
+    
+    每类执行器的在途数量上限为 workers + max_queue，超出时立即拒绝；请求被取消
+    （如客户端断开）时尚未开始的任务从池队列撤下，已在执行的任务结果被丢弃。
+    """
+    
+    def __init__(self, thread_workers: int = 8, process_workers: int = 2, max_queue: int = 64):
+        self._workers = {"thread": thread_workers, "process": process_workers}
+        self._pools: Dict[str, Any] = {}
+        self._slots = {kind: asyncio.Semaphore(workers + max_queue) for kind, workers in self._workers.items()}
+        self.stats = {kind: {"submitted": 0, "rejected": 0, "cancelled": 0, "failed": 0,
+                             "completed": 0, "pending": 0, "queue_wait_ms": 0.0, "run_ms": 0.0}
+                      for kind in self._workers}
+    
+    def _pool(self, kind: str):
+        pool = self._pools.get(kind)
+        if pool is None:
+            if kind == "thread":
+                pool = ThreadPoolExecutor(self._workers[kind], thread_name_prefix="mup-handler")
+            else:
+                pool = ProcessPoolExecutor(self._workers[kind])
+            self._pools[kind] = pool
+        return pool
+    
+    async def run(self, kind: str, fn, *args) -> Any:
+        """在 "thread" 或 "process" 执行器中运行同步函数 fn(*args)"""
+        slots = self._slots[kind]
+        stats = self.stats[kind]
+        if slots.locked():
+            stats["rejected"] += 1
+            raise ExecutorBusyError(f"{kind} 执行器排队已满")
+        
+        await slots.acquire()
+        stats["submitted"] += 1
+        stats["pending"] += 1
+        submitted = time.time()
+        loop = asyncio.get_running_loop()
+        # 配额在池中任务真正结束时才归还
+        work = self._pool(kind).submit(_timed_call, fn, *args)
+        work.add_done_callback(lambda _: self._call_soon(loop, self._release, kind))
+        try:
+            started, result = await asyncio.wrap_future(work)
+        except asyncio.CancelledError:
+            stats["cancelled"] += 1
+            raise
+        except Exception:
+            stats["failed"] += 1
+            raise
+        
+        stats["completed"] += 1
+        stats["queue_wait_ms"] += max(0.0, (started - submitted) * 1000)
+        stats["run_ms"] += (time.time() - started) * 1000
+        return result
+    
+    @staticmethod
+    def _call_soon(loop, callback, *args):
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:  # 事件循环已关闭
+            pass
+    
+    def _release(self, kind: str):
+        self.stats[kind]["pending"] -= 1
+        self._slots[kind].release()
+    
+    def shutdown(self):
+        """关闭线程池与进程池，撤下尚未开始的任务"""
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools.clear()
+
+
+class MessagePipeline:
+    """单连接消息流水线：同一排序键内保序，不同键并发，在途数量有上限"""
+    
+    def __init__(self, max_in_flight: int = 16):
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tails: Dict[Any, asyncio.Task] = {}
+        self._in_flight: set = set()
+    
+    async def submit(self, key: Any, work):
+        """提交消息处理；key 为 None 时作为屏障串行执行，在途已满时阻塞读取"""
+        if key is None:
+            await self.drain()
+            await work()
+            return
+        
+        await self._slots.acquire()
+        task = asyncio.create_task(self._run(key, self._tails.get(key), work))
+        self._tails[key] = task
+        self._in_flight.add(task)
+    
+    async def _run(self, key: Any, previous: Optional[asyncio.Task], work):
+        try:
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            await work()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"处理消息出错: {e}")
+        finally:
+            self._slots.release()
+            self._in_flight.discard(asyncio.current_task())
+            if self._tails.get(key) is asyncio.current_task():
+                del self._tails[key]
+    
+    async def drain(self):
+        """等待所有在途消息完成"""
+        if self._in_flight:
+            await asyncio.gather(*list(self._in_flight), return_exceptions=True)
+    
+    async def cancel(self):
+        """取消所有在途消息"""
+        for task in list(self._in_flight):
+            task.cancel()
+        await self.drain()
+
+
+class ChangeDebouncer:
+    """按 (客户端, 组件) 对 on_change 处理去抖与取代
+    
+    窗口内到达的新值取代旧值；正在计算的旧任务被取消，只有最新一次的结果会发送。
+    已开始发送的结果不会被中断，以免写出半条消息。
+    """
+    
+    def __init__(self, window: float = 0.15):
+        self.window = window
+        self._tasks: Dict[tuple, asyncio.Task] = {}
+        self._delivering: set = set()
+        self.stats = {"received": 0, "superseded": 0, "delivered": 0}
+    
+    def submit(self, key: tuple, compute, deliver):
+        """compute() 计算结果，deliver(result) 发送结果；同一 key 的旧任务被取代"""
+        self.stats["received"] += 1
+        previous = self._tasks.get(key)
+        if previous is not None and not previous.done() and previous not in self._delivering:
+            previous.cancel()
+            self.stats["superseded"] += 1
+        self._tasks[key] = asyncio.create_task(self._run(key, compute, deliver))
+    
+    async def _run(self, key: tuple, compute, deliver):
+        task = asyncio.current_task()
+        try:
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            result = await compute()
+            if self._tasks.get(key) is not task:
+                return
+            self._delivering.add(task)
+            await deliver(result)
+            self.stats["delivered"] += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"处理变更事件出错: {e}")
+        finally:
+            self._delivering.discard(task)
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+    
+    def cancel_client(self, client_id: str):
+        """取消某个客户端所有待处理的变更"""
+        for key in [key for key in self._tasks if key[0] == client_id]:
+            self._tasks.pop(key).cancel()
+
+
+class Route:
+    """路由表中的一项：已套好中间件的处理链，附带并发上限、超时与延迟统计"""
+    
+    __slots__ = ("name", "handler", "call", "timeout", "max_concurrency", "_slots", "stats")
+    
+    def __init__(self, name: str, handler: Callable[..., Awaitable[Any]],
+                 max_concurrency: Optional[int] = None, timeout: Optional[float] = None):
+        self.name = name
+        self.handler = handler
+        self.call = handler
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.stats = {"calls": 0, "errors": 0, "timeouts": 0, "total_ms": 0.0, "max_ms": 0.0}
+    
+    async def __call__(self, *args: Any) -> Any:
+        """执行处理链；超时时间包含等待并发配额的时间"""
+        stats = self.stats
+        stats["calls"] += 1
+        started = time.perf_counter()
+        try:
+            work = self.call(*args) if self._slots is None else self._limited(*args)
+            if self.timeout is None:
+                return await work
+            return await asyncio.wait_for(work, self.timeout)
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            raise
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            stats["total_ms"] += elapsed
+            if elapsed > stats["max_ms"]:
+                stats["max_ms"] = elapsed
+    
+    async def _limited(self, *args: Any) -> Any:
+        async with self._slots:
+            return await self.call(*args)
+
+
+class EventRouter:
+    """预编译路由表：(消息类型, 事件类型, 组件ID) -> 处理链
+    
+    组件ID 为 None 的路由匹配该事件类型的所有组件；分发最多两次字典查找，
+    处理器数量不影响每条消息的匹配开销。中间件形如 middleware(name, next) -> call。
+    """
+    
+    def __init__(self):
+        self._routes: Dict[tuple, Route] = {}
+        self._middleware: List[Callable] = []
+    
+    def use(self, middleware: Callable):
+        """追加中间件（先注册的在外层），并重新编译所有处理链"""
+        self._middleware.append(middleware)
+        for route in self._routes.values():
+            route.call = self._compose(route.name, route.handler)
+    
+    def add(self, message_type: str, handler: Callable[..., Awaitable[Any]],
+            event_type: Optional[str] = None, component_id: Optional[str] = None,
+            name: Optional[str] = None, max_concurrency: Optional[int] = None,
+            timeout: Optional[float] = None) -> Route:
+        """注册（或替换）路由"""
+        key = (message_type, event_type, component_id)
+        route = Route(name or ":".join(part for part in key if part), handler, max_concurrency, timeout)
+        route.call = self._compose(route.name, handler)
+        self._routes[key] = route
+        return route
+    
+    def lookup(self, message_type: str, event_type: Optional[str] = None,
+               component_id: Optional[str] = None) -> Optional[Route]:
+        route = self._routes.get((message_type, event_type, component_id))
+        if route is None and component_id is not None:
+            route = self._routes.get((message_type, event_type, None))
+        return route
+    
+    def _compose(self, name: str, handler: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        call = handler
+        for middleware in reversed(self._middleware):
+            call = middleware(name, call)
+        return call
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各路由的调用次数、错误、超时与延迟统计"""
+        return {route.name: dict(route.stats) for route in self._routes.values()}
+
+
+class ReplayLog:
+    """有界重放日志：保存最近 max_entries 个版本的增量操作，用于断线重连后的增量恢复"""
+    
+    def __init__(self, max_entries: int = 128):
+        self._entries: deque = deque(maxlen=max_entries)
+        self.base_version = 0  # 日志可回放的最早起点（最近一次全量更新或被截断处）
+        self.version = 0
+    
+    def reset(self, version: int):
+        """发送全量更新后日志从该版本重新开始"""
+        self._entries.clear()
+        self.base_version = self.version = version
+    
+    def append(self, version: int, operations: List[Dict[str, Any]]):
+        if len(self._entries) == self._entries.maxlen:
+            self.base_version = self._entries[0][0]
+        self._entries.append((version, operations))
+        self.version = version
+    
+    def since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        """返回从 version 升级到当前版本所需的全部操作；日志已截断或版本未知时返回 None"""
+        if not isinstance(version, int) or version < self.base_version or version > self.version:
+            return None
+        operations: List[Dict[str, Any]] = []
+        for entry_version, entry_operations in self._entries:
+            if entry_version > version:
+                operations.extend(entry_operations)
+        return operations
+
+
 class MUPServer:
     """MUP服务器"""
     
-    def __init__(self, host: str = "localhost", port: int = 8080):
+    def __init__(self, host: str = "localhost", port: int = 8080, max_in_flight_per_connection: int = 16,
+                 validation_debounce_ms: int = 150):
         self.host = host
         self.port = port
+        self.max_in_flight_per_connection = max_in_flight_per_connection
         self.clients: Dict[str, Any] = {}
         self.event_handlers: Dict[str, EventHandler] = {}
+        self.handler_execution: Dict[str, str] = {}
+        self.handler_executor = HandlerExecutor()
         self.component_trees: Dict[str, MUPComponent] = {}
+        # 每个客户端最近一次发送的组件树快照及版本，用于增量更新
+        self.tree_snapshots: Dict[str, Dict[str, Any]] = {}
+        self.tree_versions: Dict[str, int] = {}
+        # 会话：client_id -> session_id；断线的会话保留组件树状态与重放日志以便增量恢复
+        self.client_sessions: Dict[str, str] = {}
+        self.replay_logs: Dict[str, ReplayLog] = {}
+        self.detached_sessions: OrderedDict = OrderedDict()
+        self.max_detached_sessions = 1000
+        # 每个客户端输入组件的最新取值，提交时用于整表校验
+        self.form_values: Dict[str, Dict[str, Any]] = {}
+        # on_change 校验去抖窗口，同一输入框的连续按键只校验并回复最后一次
+        self.change_debouncer = ChangeDebouncer(validation_debounce_ms / 1000)
         
         # 注册默认事件处理器
         self.register_handler("validation", FormValidationHandler())
         self.register_handler("submit", SubmitHandler())
+        
+        # 路由表在注册时编译，消息分发只做字典查找
+        self.router = EventRouter()
+        self.router.add("handshake_request", self.handle_handshake, name="handshake")
+        self.router.add("event_notification", self.handle_change, event_type="on_change", name="change")
+        self.register_submit_button("submit_button")
     
-    def register_handler(self, name: str, handler: EventHandler):
-        """注册事件处理器"""
+    def register_handler(self, name: str, handler: EventHandler, execution: Optional[str] = None):
+        """注册事件处理器；execution 覆盖处理器声明的执行类别（inline/thread/process）"""
+        execution = execution or handler.execution
+        if execution not in ("inline", "thread", "process"):
+            raise ValueError(f"未知的执行类别: {execution}")
+        if execution != "inline" and type(handler).handle_blocking is EventHandler.handle_blocking:
+            raise ValueError(f"{type(handler).__name__} 未实现 handle_blocking()，不能以 {execution} 方式运行")
         self.event_handlers[name] = handler
+        self.handler_execution[name] = execution
+    
+    async def invoke_handler(self, name: str, event_data: Dict[str, Any],
+                             context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """按注册时的执行类别调用事件处理器"""
+        handler = self.event_handlers[name]
+        execution = self.handler_execution.get(name, "inline")
+        if execution == "inline":
+            return await handler.handle(event_data, context)
+        # 组件树不随任务传给执行器（进程池需要 pickle 全部参数）
+        context = {key: value for key, value in context.items() if key != "component_tree"}
+        return await self.handler_executor.run(execution, handler.handle_blocking, event_data, context)
+    
+    def register_submit_button(self, component_id: str, timeout: Optional[float] = 10.0):
+        """将按钮的点击事件路由到表单提交流程"""
+        self.router.add("event_notification", self.handle_submit, event_type="on_click",
+                        component_id=component_id, name=f"submit:{component_id}",
+                        max_concurrency=32, timeout=timeout)
     
     async def start_server(self):
         """启动服务器"""
         print(f"MUP服务器启动在 ws://{self.host}:{self.port}")
         
-        async with websockets.serve(self.handle_client, self.host, self.port):
-            await asyncio.Future()  # 永远运行
+        try:
+            async with websockets.serve(self.handle_client, self.host, self.port):
+                await asyncio.Future()  # 永远运行
+        finally:
+            self.handler_executor.shutdown()
     
     async def handle_client(self, websocket):
         """处理客户端连接"""
@@ -253,58 +931,170 @@ class MUPServer:
         self.clients[client_id] = websocket
         
         print(f"客户端 {client_id} 已连接")
+        pipeline = MessagePipeline(self.max_in_flight_per_connection)
         
         try:
-            async for message in websocket:
-                await self.handle_message(client_id, json.loads(message))
+            async for raw in websocket:
+                message = json.loads(raw)
+                await pipeline.submit(
+                    self.ordering_key(message),
+                    lambda message=message: self.handle_message(client_id, message)
+                )
+            await pipeline.drain()
         except websockets.exceptions.ConnectionClosed:
             print(f"客户端 {client_id} 已断开连接")
         finally:
+            await pipeline.cancel()
             if client_id in self.clients:
                 del self.clients[client_id]
+            self._detach_session(client_id)
+            self.form_values.pop(client_id, None)
+            self.change_debouncer.cancel_client(client_id)
+            validator = self.event_handlers.get("validation")
+            if isinstance(validator, FormValidationHandler):
+                validator.discard(client_id)
+    
+    def _detach_session(self, client_id: str):
+        """客户端断开时保留其会话的组件树状态，超过上限时淘汰最早断开的会话"""
+        session_id = self.client_sessions.pop(client_id, None)
+        component = self.component_trees.pop(client_id, None)
+        snapshot = self.tree_snapshots.pop(client_id, None)
+        version = self.tree_versions.pop(client_id, None)
+        log = self.replay_logs.pop(session_id, None)
+        if session_id is None or component is None or log is None:
+            return
+        self.detached_sessions[session_id] = {
+            "component": component,
+            "snapshot": snapshot,
+            "version": version,
+            "log": log
+        }
+        while len(self.detached_sessions) > self.max_detached_sessions:
+            self.detached_sessions.popitem(last=False)
+    
+    @staticmethod
+    def ordering_key(message: Dict[str, Any]) -> Any:
+        """用户交互按组件保序并发处理，握手等其他消息作为屏障"""
+        mup_data = message.get("mup", {})
+        payload = mup_data.get("payload", {})
+        if mup_data.get("message_type") == "event_notification":
+            return ("component", payload.get("event", {}).get("component_id"))
+        return None
     
     async def handle_message(self, client_id: str, message: Dict[str, Any]):
-        """处理客户端消息"""
+        """处理客户端消息：按预编译路由表分发"""
         mup_data = message.get("mup", {})
         payload = mup_data.get("payload", {})
         message_type = mup_data.get("message_type")
         
-        if message_type == "handshake_request" and payload.get("type") == "handshake":
-            await self.handle_handshake(client_id, payload)
-        elif message_type == "event_notification" and payload.get("type") == "user_interaction":
-            await self.handle_user_interaction(client_id, payload)
+        if message_type == "event_notification":
+            event = payload.get("event", {})
+            component_id = event.get("component_id")
+            event_type = event.get("event_type")
+            print(f"用户交互: {component_id} - {event_type}")
+            route = self.router.lookup(message_type, event_type, component_id)
         else:
-            print(f"未知消息类型: {message_type}")
+            route = self.router.lookup(message_type)
+        
+        if route is None:
+            if message_type != "event_notification":
+                print(f"未知消息类型: {message_type}")
+            return
+        try:
+            await route(client_id, payload)
+        except asyncio.TimeoutError:
+            print(f"处理器 {route.name} 超时")
+        except ExecutorBusyError as e:
+            print(f"处理器 {route.name} 被拒绝: {e}")
     
     async def handle_handshake(self, client_id: str, payload: Dict[str, Any]):
-        """处理握手"""
+        """处理握手；携带 session_id 与 last_version 重连时只补发错过的增量操作"""
         print(f"处理客户端 {client_id} 的握手")
         
+        session_id = payload.get("session_id") or client_id
+        owner = next((other for other, sid in self.client_sessions.items()
+                      if sid == session_id and other != client_id), None)
+        if owner is not None:
+            # 会话正被其他在线客户端使用，不允许共享，改为分配新会话
+            print(f"会话 {session_id} 已被客户端 {owner} 使用，为 {client_id} 分配新会话")
+            session_id = client_id
+        self.client_sessions[client_id] = session_id
+        detached = self.detached_sessions.pop(session_id, None)
+        if detached is not None:
+            # 恢复会话的组件树状态
+            self.component_trees[client_id] = detached["component"]
+            self.tree_snapshots[client_id] = detached["snapshot"]
+            self.tree_versions[client_id] = detached["version"]
+            log = self.replay_logs[session_id] = detached["log"]
+            
+            last_version = payload.get("last_version")
+            operations = log.since(last_version) if last_version is not None else None
+            if operations is not None:
+                print(f"会话 {session_id} 从版本 {last_version} 增量恢复，补发 {len(operations)} 个操作")
+                await self.clients[client_id].send(json.dumps(self._build_message("incremental_update", {
+                    "type": "incremental_update",
+                    "base_version": last_version,
+                    "target_version": log.version,
+                    "operations": operations
+                })))
+            else:
+                # 重放日志已截断：发送会话当前组件树的完整快照
+                await self.send_component_tree(client_id, detached["component"], force_full=True)
+            return
+        
         # 发送初始UI
+        if session_id not in self.replay_logs:
+            self.replay_logs[session_id] = ReplayLog()
         ui_tree = self.generate_registration_form()
-        await self.send_component_tree(client_id, ui_tree)
+        await self.send_component_tree(client_id, ui_tree, force_full=True)
+    
+    def _event_context(self, client_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """事件处理器的上下文：客户端上下文加上当前组件树及其版本"""
+        return {
+            **payload.get("context", {}),
+            "client_id": client_id,
+            "component_tree": self.component_trees.get(client_id),
+            "tree_version": self.tree_versions.get(client_id)
+        }
     
-    async def handle_user_interaction(self, client_id: str, payload: Dict[str, Any]):
-        """处理用户交互"""
+    async def handle_change(self, client_id: str, payload: Dict[str, Any]):
+        """输入变化：记录取值并去抖校验"""
+        if "validation" not in self.event_handlers:
+            return
         event = payload.get("event", {})
         component_id = event.get("component_id")
-        event_type = event.get("event_type")
         event_payload = event.get("payload", {})
+        context = self._event_context(client_id, payload)
+        self.form_values.setdefault(client_id, {})[component_id] = event_payload.get("value", "")
         
-        print(f"用户交互: {component_id} - {event_type}")
-        
-        # 根据事件类型选择处理器
-        if "change" in event_type and "validation" in self.event_handlers:
-            result = await self.event_handlers["validation"].handle(event_payload, payload.get("context", {}))
+        async def deliver(result: Optional[Dict[str, Any]]):
             if result:
                 await self.send_validation_result(client_id, component_id, result)
         
-        elif "click" in event_type and "submit" in component_id:
-            # 收集表单数据
-            form_data = await self.collect_form_data(client_id)
-            result = await self.event_handlers["submit"].handle(form_data, payload.get("context", {}))
-            if result:
-                await self.send_submit_result(client_id, result)
+        self.change_debouncer.submit(
+            (client_id, component_id),
+            lambda: self.invoke_handler("validation", event_payload, context),
+            deliver
+        )
+    
+    async def handle_submit(self, client_id: str, payload: Dict[str, Any]):
+        """提交按钮点击：整表校验后交给提交处理器"""
+        context = self._event_context(client_id, payload)
+        
+        # 提交前按组件树声明的规则整表校验
+        validator = self.event_handlers.get("validation")
+        if isinstance(validator, FormValidationHandler):
+            errors = validator.validate_form(self.form_values.get(client_id, {}), context)
+            if errors:
+                for field_id, message in errors.items():
+                    await self.send_validation_result(client_id, field_id, {"valid": False, "message": message})
+                return
+        
+        # 收集表单数据
+        form_data = await self.collect_form_data(client_id)
+        result = await self.invoke_handler("submit", form_data, context)
+        if result:
+            await self.send_submit_result(client_id, result)
     
     def generate_registration_form(self) -> MUPComponent:
         """生成注册表单"""
@@ -384,8 +1174,6 @@ class MUPServer:
             color="#007bff",
             align="center"
         )
-        if login_link.events is None:
-            login_link.events = {}
         login_link.events["on_click"] = {
             "handler": "navigate_to_login",
             "payload_schema": {"component_id": "string"}
@@ -396,9 +1184,9 @@ class MUPServer:
         
         return form
     
-    async def send_component_tree(self, client_id: str, component: MUPComponent):
-        """发送组件树到客户端"""
-        message = {
+    def _build_message(self, message_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """构建MUP消息信封"""
+        return {
             "mup": {
                 "version": "1.0.0",
                 "message_id": str(uuid.uuid4()),
@@ -408,19 +1196,73 @@ class MUPServer:
                     "id": "mup-server",
                     "version": "1.0.0"
                 },
-                "message_type": "component_update",
-                "payload": {
-                    "type": "component_tree_update",
-                    "version": "1.0.0",
-                    "timestamp": datetime.now().isoformat(),
-                    "update_type": "full",
-                    "root_component": component.to_dict()
-                }
+                "message_type": message_type,
+                "payload": payload
             }
         }
+    
+    async def send_component_tree(self, client_id: str, component: MUPComponent, force_full: bool = False):
+        """发送组件树到客户端；已有快照时优先发送增量更新，全量更新流式编码
+        
+        全量更新先流式发送再生成快照，首字节不等待整棵树的字典构建；
+        为计算下一次增量，每个客户端保存一份组件树字典快照。
+        """
+        base_version = self.tree_versions.get(client_id, 0)
+        target_version = base_version + 1
+        previous = self.tree_snapshots.get(client_id)
+        
+        message = None
+        tree = None
+        if previous is not None and not force_full:
+            tree = component.snapshot()
+            operations = ComponentTreeDiffer.diff(previous, tree)
+            if not operations:
+                return
+            patch_payload = {
+                "type": "incremental_update",
+                "base_version": base_version,
+                "target_version": target_version,
+                "operations": operations
+            }
+            patch_message = json.dumps(self._build_message("incremental_update", patch_payload))
+            # 补丁不比完整组件树小时回退为全量更新；只编码到超过补丁长度为止
+            encoded = 0
+            for fragment in component.iter_json():
+                encoded += len(fragment)
+                if encoded > len(patch_message):
+                    message = patch_message
+                    break
+        
+        self.component_trees[client_id] = component
+        self.tree_versions[client_id] = target_version
+        log = self.replay_logs.get(self.client_sessions.get(client_id))
+        if log is not None:
+            if message is not None:
+                log.append(target_version, operations)
+            else:
+                log.reset(target_version)
         
+        if message is not None:
+            self.tree_snapshots[client_id] = tree
+            if client_id in self.clients:
+                await self.clients[client_id].send(message)
+            return
+        
+        # 全量发送期间没有快照，并发的更新也走全量，不会基于旧快照计算增量
+        self.tree_snapshots.pop(client_id, None)
         if client_id in self.clients:
-            await self.clients[client_id].send(json.dumps(message))
+            envelope = self._build_message("component_update", {
+                "type": "component_tree_update",
+                "version": "1.0.0",
+                "timestamp": datetime.now().isoformat(),
+                "update_type": "full",
+                "target_version": target_version,
+                "session_id": self.client_sessions.get(client_id),
+                "root_component": STREAM_PLACEHOLDER
+            })
+            await send_chunks(self.clients[client_id], iter_message_chunks(envelope, component))
+        if self.tree_versions.get(client_id) == target_version:
+            self.tree_snapshots[client_id] = tree if tree is not None else component.snapshot()
     
     async def send_validation_result(self, client_id: str, component_id: str, result: Dict[str, Any]):
         """发送验证结果"""
@@ -455,6 +1297,7 @@ class AIFormGenerator:
     
     def __init__(self, mup_server: MUPServer):
         self.server = mup_server
+        self.server.register_submit_button("contact_submit")
     
     async def generate_dynamic_form(self, requirements: str) -> MUPComponent:
         """根据需求生成动态表单"""
@@ -468,6 +1311,68 @@ class AIFormGenerator:
         else:
             return self.server.generate_registration_form()
     
+    async def stream_dynamic_form(self, requirements: str,
+                                  token_stream: Optional[AsyncIterator[str]] = None) -> AsyncIterator[MUPComponent]:
+        """流式生成动态表单：每解析出一个完整节点就产出一次当前的部分组件树
+        
+        模型按行输出节点（JSON Lines，每行包含 parent 字段）；容器节点到达后立即
+        产出并带一个占位子组件，之后的子组件插入占位符之前，生成结束时移除占位符。
+        产出的始终是同一个根对象，调用方可直接交给 send_component_tree 计算增量补丁。
+        没有真实的模型输出流时直接产出完整组件树（fake_token_stream 仅用于测试与演示）。
+        """
+        if token_stream is None:
+            yield await self.generate_dynamic_form(requirements)
+            return
+        
+        root: Optional[MUPComponent] = None
+        nodes: Dict[str, MUPComponent] = {}
+        placeholders: Dict[str, MUPComponent] = {}
+        buffer = ""
+        async for token in token_stream:
+            buffer += token
+            while "\n" in buffer:
+                line, buffer = buffer.split("\n", 1)
+                if not line.strip():
+                    continue
+                spec = json.loads(line)
+                node = MUPComponent(id=spec["id"], type=spec["type"],
+                                    props=spec.get("props"), events=spec.get("events"))
+                parent = nodes.get(spec.get("parent"))
+                if parent is None:
+                    if root is not None:
+                        continue
+                    root = node
+                else:
+                    if parent.id in placeholders:
+                        parent.children.insert(len(parent.children) - 1, node)
+                    else:
+                        parent.children.append(node)
+                nodes[node.id] = node
+                if node.type == "container":
+                    placeholder = ComponentBuilder.text(f"{node.id}__placeholder", "生成中…", "caption")
+                    node.children.append(placeholder)
+                    placeholders[node.id] = placeholder
+                yield root
+        
+        if root is None:
+            return
+        for container_id, placeholder in placeholders.items():
+            nodes[container_id].children.remove(placeholder)
+        yield root
+    
+    async def stream_to_client(self, client_id: str, requirements: str,
+                               token_stream: Optional[AsyncIterator[str]] = None) -> Optional[float]:
+        """将流式生成的表单逐步推送给客户端，返回首次渲染耗时（毫秒）"""
+        started = time.perf_counter()
+        first_render_ms = None
+        async for partial in self.stream_dynamic_form(requirements, token_stream):
+            await self.server.send_component_tree(client_id, partial)
+            if first_render_ms is None:
+                first_render_ms = (time.perf_counter() - started) * 1000
+                print(f"客户端 {client_id} 首次渲染耗时 {first_render_ms:.1f}ms")
+        print(f"客户端 {client_id} 表单生成完成，总耗时 {(time.perf_counter() - started) * 1000:.1f}ms")
+        return first_render_ms
+    
     def generate_contact_form(self) -> MUPComponent:
         """生成联系表单"""
         form = ComponentBuilder.container(
@@ -503,6 +1408,23 @@ class AIFormGenerator:
         return form
 
 
+async def fake_token_stream(component: MUPComponent, token_size: int = 8,
+                            delay: float = 0.02) -> AsyncIterator[str]:
+    """模拟模型的逐 token 输出：按先序遍历把节点写成 JSON Lines 再切成小片段"""
+    def walk(node: MUPComponent, parent: Optional[str]):
+        spec = {"id": node.id, "type": node.type, "parent": parent, "props": node.props}
+        if node.events:
+            spec["events"] = node.events
+        yield json.dumps(spec, ensure_ascii=False) + "\n"
+        for child in node.children:
+            yield from walk(child, node.id)
+    
+    text = "".join(walk(component, None))
+    for start in range(0, len(text), token_size):
+        await asyncio.sleep(delay)
+        yield text[start:start + token_size]
+
+
 async def main():
     """主函数"""
     server = MUPServer(host="localhost", port=8080)